@@ -0,0 +1 @@
+# Lets pytest import the envs package when the tests are run from gym-multi-k8s/
@@ -0,0 +1,211 @@
+import math
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:  # numba is optional: fall back to the plain Python functions
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda f: f
+
+# Clusters are considered full above this share of their capacity
+FULL_THRESHOLD = 0.95
+
+# Fast-math flags of the split factor kernels: the inputs are never NaN, and the signed zero does not matter
+# for a ceil that ends in an int. No reciprocal approximation, so the split factors stay bit-identical
+SPLIT_FASTMATH = {'nnan', 'nsz'}
+
+
+# Smallest split factor over the clusters, i.e. ceil(min(min(free_cpu / cpu_req, free_mem / mem_req)))
+# A single pass without the temporary arrays of np.minimum
+@njit(cache=True, fastmath=SPLIT_FASTMATH)
+def min_split_factor(cpu_req, mem_req, free_cpu, free_mem):
+    min_split = np.inf
+    for n in range(free_cpu.shape[0]):
+        split = min(free_cpu[n] / cpu_req, free_mem[n] / mem_req)
+        if split < min_split:
+            min_split = split
+    return int(math.ceil(min_split))
+
+
+# Two replicas: with free resources left everywhere the min factor is 1, so no split factors or sort are needed
+# FFD places one replica on each of the first two fitting clusters by decreasing free CPU (ties to the lowest index)
+# FFI places one on the first fitting cluster by increasing free CPU, then one on the lowest fitting index
+# Returns None when some cluster has no free resources left and the general path must run
+@njit(cache=True)
+def first_fit_pair(cpu_req, mem_req, free_cpu, free_mem, decreasing):
+    num_clusters = free_cpu.shape[0]
+    lowest = -1
+    first = -1
+    second = -1
+
+    for n in range(num_clusters):
+        if free_cpu[n] <= 0 or free_mem[n] <= 0:
+            return None
+        if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
+            if lowest < 0:
+                lowest = n
+            if first < 0 or (free_cpu[n] > free_cpu[first] if decreasing else free_cpu[n] < free_cpu[first]):
+                second = first
+                first = n
+            elif second < 0 or free_cpu[n] > free_cpu[second]:
+                second = n
+
+    distribution = np.zeros(num_clusters, dtype=np.int64)
+    if first >= 0:
+        distribution[first] += 1
+        # A single fitting cluster also takes the second replica
+        distribution[second if decreasing and second >= 0 else lowest] += 1
+    return distribution
+
+
+# Current Strategy: First Fit Decreasing (FFD)
+@njit(cache=True, fastmath=SPLIT_FASTMATH)
+def first_fit_decreasing(num_replicas, cpu_req, mem_req, free_cpu, free_mem):
+    if num_replicas == 2:
+        distribution = first_fit_pair(cpu_req, mem_req, free_cpu, free_mem, True)
+        if distribution is not None:
+            return distribution
+
+    num_clusters = free_cpu.shape[0]
+    distribution = np.zeros(num_clusters, dtype=np.int64)
+
+    # min and max replicas
+    min_replicas = 1
+    max_replicas = num_replicas
+
+    # Distribute the replicas across clusters
+    min_factor = min_split_factor(cpu_req, mem_req, free_cpu, free_mem)
+    if min_factor >= max_replicas:
+        min_factor = max_replicas - 1  # To really distribute at the end
+
+    # Sort the clusters by their remaining capacity (CPU) in decreasing order
+    for n in np.argsort(-free_cpu, kind='mergesort'):
+        if num_replicas == 0:
+            break
+        if num_replicas > 0 and min_factor < num_replicas and (
+                (cpu_req * min_factor < free_cpu[n]) and (mem_req * min_factor < free_mem[n])):
+            distribution[n] += min_factor
+            num_replicas -= min_factor
+        elif num_replicas > 0 and ((cpu_req < free_cpu[n]) and (mem_req < free_mem[n])):
+            distribution[n] += min_replicas
+            num_replicas -= min_replicas
+
+    # Still distribute remaining replicas if needed
+    for n in range(num_clusters):
+        if num_replicas == 0:
+            break
+        if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
+            distribution[n] += min_replicas
+            num_replicas -= min_replicas
+
+    return distribution
+
+
+# Current Strategy: First Fit Increasing (FFI)
+@njit(cache=True, fastmath=SPLIT_FASTMATH)
+def first_fit_increasing(num_replicas, cpu_req, mem_req, free_cpu, free_mem):
+    if num_replicas == 2:
+        distribution = first_fit_pair(cpu_req, mem_req, free_cpu, free_mem, False)
+        if distribution is not None:
+            return distribution
+
+    num_clusters = free_cpu.shape[0]
+    distribution = np.zeros(num_clusters, dtype=np.int64)
+
+    # Calculate minimum split factor
+    min_factor = min_split_factor(cpu_req, mem_req, free_cpu, free_mem)
+    if min_factor >= num_replicas:
+        min_factor = num_replicas - 1  # To really distribute at the end
+
+    # Sort the clusters by their remaining capacity (CPU) in increasing order
+    # Nothing more is placed in this pass once the min factor no longer fits in the remaining replicas
+    for n in np.argsort(free_cpu, kind='mergesort'):
+        if min_factor >= num_replicas:
+            break
+        if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
+            distribution[n] += min_factor
+            num_replicas -= min_factor
+
+    # Still distribute remaining replicas if needed
+    for n in range(num_clusters):
+        if num_replicas == 0:
+            break
+        if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
+            distribution[n] += 1
+            num_replicas -= 1
+
+    return distribution
+
+
+# Best Fit placing one replica at a time (BF1B1)
+@njit(cache=True)
+def best_fit_1b1(num_replicas, cpu_req, mem_req, free_cpu, free_mem):
+    num_clusters = free_cpu.shape[0]
+    distribution = np.zeros(num_clusters, dtype=np.int64)
+
+    # Work on copies: the caller's free resources are only updated if the split is accepted
+    free_cpu = free_cpu.copy()
+    free_mem = free_mem.copy()
+
+    # Distribute the replicas across clusters
+    for _ in range(num_replicas):
+        # Single pass for the tightest fit, no sort needed
+        # Ties go to the cluster with less free CPU, then to the lowest index
+        best_fit_bin = -1
+        best_fit_space = np.inf
+
+        for cluster_idx in range(num_clusters):
+            if free_cpu[cluster_idx] >= cpu_req and free_mem[cluster_idx] >= mem_req:
+                space = free_cpu[cluster_idx] - cpu_req + free_mem[cluster_idx] - mem_req
+                if space < best_fit_space or (space == best_fit_space
+                                              and free_cpu[cluster_idx] < free_cpu[best_fit_bin]):
+                    best_fit_bin = cluster_idx
+                    best_fit_space = space
+
+        # Nothing fits: the remaining replicas cannot be placed either
+        if best_fit_bin < 0:
+            break
+
+        distribution[best_fit_bin] += 1
+        free_cpu[best_fit_bin] -= cpu_req
+        free_mem[best_fit_bin] -= mem_req
+
+    return distribution
+
+
+# Double-check if the selected clusters are full (spread strategy), thresholds are FULL_THRESHOLD * capacity
+@njit(cache=True)
+def clusters_full_after_split(div, cpu_req, mem_req, allocated_cpu, allocated_memory, cpu_threshold, memory_threshold):
+    for d in range(div.shape[0]):
+        if (allocated_cpu[d] + cpu_req * div[d] > cpu_threshold[d]
+                or allocated_memory[d] + mem_req * div[d] > memory_threshold[d]):
+            return True
+    return False
+
+
+# Vectorized form of clusters_full_after_split, for plain Python where the loop above is not compiled
+def clusters_full_after_split_np(div, cpu_req, mem_req, allocated_cpu, allocated_memory,
+                                 cpu_threshold, memory_threshold):
+    return bool((allocated_cpu + cpu_req * div > cpu_threshold).any()
+                or (allocated_memory + mem_req * div > memory_threshold).any())
+
+
+# Trigger compilation (or load the on-disk cache) before the first step
+# The env passes columns of its packed resources array: warm up with the same non-contiguous layout
+def warmup():
+    free = np.ones((2, 2), dtype=np.float64)[:, 0]
+    div = first_fit_decreasing(2, 0.1, 0.1, free, free)
+    first_fit_increasing(2, 0.1, 0.1, free, free)
+    best_fit_1b1(2, 0.1, 0.1, free, free)
+    clusters_full_after_split(div, 0.1, 0.1, free, free, free, free)
+
+
+# Without numba, the split check runs as a vectorized NumPy expression instead of the plain Python loop
+if not NUMBA_AVAILABLE:
+    clusters_full_after_split = clusters_full_after_split_np
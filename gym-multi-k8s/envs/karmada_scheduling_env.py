@@ -1,20 +1,22 @@
+import copy
 import csv
-import math
-import operator
-from datetime import datetime
-import heapq
 import time
 import random
-from statistics import mean
+import weakref
 
 import gym
 import numpy as np
 from gym import spaces
 from gym.utils import seeding
-from envs.utils import DeploymentRequest, get_c2e_deployment_list, save_to_csv, sort_dict_by_value, \
-    calculate_gini_coefficient, normalize
+from envs.utils import DeploymentRequest, get_c2e_deployment_list, save_to_csv, \
+    calculate_gini_coefficient
+from envs import heuristics_nb
 import logging
 
+# Hot paths check the level before building their messages (evaluated per call, after logging is configured)
+# The checks are behind __debug__ too, so running with python -O compiles the step logging out entirely
+_log = logging.getLogger(__name__)
+
 # MAX Number of Replicas per deployment request
 MAX_REPLICAS = 8
 MIN_REPLICAS = 1
@@ -43,6 +45,7 @@ LATENCY = 'latency'
 COST = 'cost'
 MAX_COST = 16  # Defined based on the max cost in DEFAULT_CLUSTER_TYPES
 MIN_COST = 1  # Defined based on the min cost in DEFAULT_CLUSTER_TYPES
+COST_SCALE = 1.0 / (MAX_COST - MIN_COST)  # normalizes costs to [0, 1]
 
 MULTI = 'multi'
 
@@ -59,6 +62,9 @@ DEFAULT_CLUSTER_TYPES = [{"type": "edge_tier_1", "cpu": 2.0, "mem": 2.0, "cost":
                          {"type": "fog_tier_2", "cpu": 4.0, "mem": 16.0, "cost": 8},
                          {"type": "cloud", "cpu": 8.0, "mem": 32.0, "cost": 16}]
 
+# Cluster types as a (cpu, mem, cost) table indexed by type id
+CLUSTER_TABLE = np.array([[t['cpu'], t['mem'], t['cost']] for t in DEFAULT_CLUSTER_TYPES], dtype=np.float64)
+
 # DEFAULTS for Env configuration
 DEFAULT_NUM_EPISODE_STEPS = 100
 DEFAULT_NUM_CLUSTERS = 4
@@ -74,15 +80,47 @@ NUM_SPREADING_ACTIONS = 3
 FFD = 0
 FFI = 1
 BF1B1 = 2
-# NF1B1 = 3
-# BFD = 4
 
 # Defaults for latency
 MIN_DELAY = 1  # corresponds to 1ms
 MAX_DELAY = 1000  # corresponds to 1000ms
+LATENCY_SCALE = 1.0 / (MAX_DELAY - MIN_DELAY)  # normalizes latencies to [0, 1]
+
+# Latency factors applied on deployment and reverted on departure
+FULL_LATENCY_FACTOR = np.float64(1.15)  # 15% increase max
+SPLIT_LATENCY_FACTOR = np.float64(1.05)  # 5% increase max, only where replicas were placed
+SPLIT_RELEASE_FACTOR = np.float64(1.10)  # only 10% reduction if split
 
 SEED = 42
 
+# Initial capacity of the running requests queue (doubled when full)
+QUEUE_CAPACITY = 64
+QUEUE_FIELDS = ('_q_cluster', '_q_cpu', '_q_mem', '_q_rep', '_q_exp', '_q_factor')
+
+# Per-cluster resource arrays, the columns of a single (num_clusters, 8) array (cpu and memory side by side)
+RESOURCE_FIELDS = ('allocated_cpu', 'allocated_memory', 'cpu_capacity', 'memory_capacity',
+                   'free_cpu', 'free_memory', 'cpu_threshold', 'memory_threshold')
+ALLOCATED = slice(0, 2)
+CAPACITY = slice(2, 4)
+FREE = slice(4, 6)
+THRESHOLD = slice(6, 8)
+
+# Keys of the info dict returned by step, in insertion order (VecMonitor info_keywords)
+INFO_KEYWORDS = ('reward_step', 'action', 'reward', 'ep_block_prob', 'ep_accepted_requests', 'ep_rejected_requests',
+                 'ep_deploy_all', 'ep_ffd', 'ep_ffi', 'ep_bf1b1', 'avg_latency', 'avg_cost',
+                 'avg_cpu_cluster_selected', 'gini', 'executionTime')
+
+# Observation csv rows kept in memory before being written in one batch
+OBS_CSV_BATCH_ROWS = 1024
+
+
+# Write the rows kept in memory, then close the csv file (also run by the env finalizers)
+def write_and_close_csv(fh, writer, rows):
+    if rows:
+        writer.writerows(rows)
+        rows.clear()
+    fh.close()
+
 
 class KarmadaSchedulingEnv(gym.Env):
     """ Karmada Scheduling env in Kubernetes - an OpenAI gym environment"""
@@ -106,12 +144,28 @@ class KarmadaSchedulingEnv(gym.Env):
         self.name = "karmada_gym"
         self.__version__ = "0.0.1"
         self.reward_function = reward_function
+        # Reward function resolved once instead of comparing strings every step
+        self._reward_fn = {NAIVE: self._reward_naive,
+                           MULTI: self._reward_multi,
+                           LATENCY: self._reward_latency,
+                           COST: self._reward_cost}.get(reward_function, self._reward_unrecognized)
 
         self.num_clusters = num_clusters
         self.arrival_rate_r = arrival_rate_r
         self.call_duration_r = call_duration_r
         self.episode_length = episode_length
-        self.running_requests: list[DeploymentRequest] = []
+
+        # Running requests: cluster, per-replica cpu/mem, replicas, departure time and latency factor
+        # Only the first _q_size slots are in use, released slots within them have an infinite departure time
+        # _q_next_exp is the earliest departure time in use (the top of the former heap), inf when empty
+        self._q_size = 0
+        self._q_next_exp = np.inf
+        self._q_cluster = np.zeros(QUEUE_CAPACITY, dtype=np.int64)
+        self._q_cpu = np.zeros(QUEUE_CAPACITY, dtype=np.float64)
+        self._q_mem = np.zeros(QUEUE_CAPACITY, dtype=np.float64)
+        self._q_rep = np.zeros(QUEUE_CAPACITY, dtype=np.float64)
+        self._q_exp = np.zeros(QUEUE_CAPACITY, dtype=np.float64)
+        self._q_factor = np.zeros(QUEUE_CAPACITY, dtype=np.float64)
 
         # For Request generation
         self.min_replicas = min_replicas
@@ -119,14 +173,14 @@ class KarmadaSchedulingEnv(gym.Env):
 
         # For Latency purposes
         self.latency_matrix = np.zeros((num_clusters, num_clusters))
-        self.num_metrics_latency = 0
         self.latency = np.zeros(num_clusters)
 
         self.seed = seed
         self.np_random, seed = seeding.np_random(self.seed)
 
-        logging.info(
-            "[Init] Env: {} | Version {} | Num_Clusters: {} |".format(self.name, self.__version__, num_clusters))
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Init] Env: {} | Version {} | Num_Clusters: {} |".format(
+                self.name, self.__version__, num_clusters))
 
         # Defined as a matrix having as rows the nodes and columns their associated metrics
         self.observation_space = spaces.Box(low=0.0,
@@ -134,19 +188,13 @@ class KarmadaSchedulingEnv(gym.Env):
                                             shape=(num_clusters + NUM_SPREADING_ACTIONS + 1,
                                                    NUM_METRICS_CLUSTER + NUM_METRICS_REQUEST + 2),
                                             dtype=np.float32)
+        self._obs_buf = np.zeros(self.observation_space.shape, dtype=np.float32)
 
-        # Default latency matrix
-        for n1 in range(num_clusters):
-            for n2 in range(num_clusters):
-                if n1 == n2:  # for the same node assume 0
-                    self.latency_matrix[n1][n2] = 0
-                else:
-                    self.latency_matrix[n1][n2] = self.np_random.integers(low=MIN_DELAY, high=MAX_DELAY)
+        # Action masks, reused on every call: the 3 strategies + Reject stay valid, only the cluster entries change
+        self._action_mask_buf = np.ones(num_clusters + NUM_SPREADING_ACTIONS + 1, dtype=bool)
 
-            self.latency[n1] = mean(self.latency_matrix[n1])
-
-        # logging.info("[Init] Latency Matrix: {}".format(self.latency_matrix))
-        # logging.info("[Init] Latency: {}".format(self.latency))
+        # Default latency matrix: for the same node assume 0
+        self.draw_latency_matrix()
 
         # Action Space
         # deploy the service on cluster 1,2,..., n + spreading actions + reject it
@@ -155,59 +203,56 @@ class KarmadaSchedulingEnv(gym.Env):
         # Discrete action space
         self.action_space = spaces.Discrete(self.num_actions)
 
+        # Spreading actions: name, heuristic and counter of each strategy (FFI has always run the FFD heuristic)
+        self._split_heuristics = {FFD: ('FFD', self.first_fit_decreasing_heuristic, 'deploy_ffd'),
+                                  FFI: ('FFI', self.first_fit_decreasing_heuristic, 'deploy_ffi'),
+                                  BF1B1: ('BF1B1', self.best_fit_heuristic_one_by_one, 'deploy_bf1b1')}
+
+        # Handler and argument of each action id: full deployment per cluster, spreading strategies, reject
+        self._action_table = ([(self.deploy_all_replicas, c) for c in range(num_clusters)]
+                              + [(self.deploy_split_replicas, s) for s in range(NUM_SPREADING_ACTIONS)]
+                              + [(self.reject_request, None)])
+
         # Action and Observation Space
-        logging.info("[Init] Action Space: {}".format(self.action_space))
-        logging.info("[Init] Observation Space: {}".format(self.observation_space))
-        # logging.info("[Init] Observation Space Shape: {}".format(self.observation_space.shape))
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Init] Action Space: {}".format(self.action_space))
+            _log.info("[Init] Observation Space: {}".format(self.observation_space))
 
         # Setting the experiment based on Cloud2Edge (C2E) deployments
-        self.deploymentList = get_c2e_deployment_list()
+        self._deployment_template = get_c2e_deployment_list()
         self.deployment_request = None
 
         # New: Resource capacities based on cluster type
-        self.cpu_capacity = np.zeros(num_clusters)
-        self.memory_capacity = np.zeros(num_clusters)
         self.default_cluster_types = DEFAULT_CLUSTER_TYPES
-        self.cluster_type = [0] * num_clusters  # np.zeros(num_clusters)
-
-        logging.info("[Init] Resource Capacity calculation... ")
-        for c in range(num_clusters):
-            type = int(self.np_random.integers(low=0, high=NUM_CLUSTER_TYPES))
-            self.cluster_type[c] = type
-            self.cpu_capacity[c] = DEFAULT_CLUSTER_TYPES[type]['cpu']
-            self.memory_capacity[c] = DEFAULT_CLUSTER_TYPES[type]['mem']
-            logging.info("[Init] Cluster id: {} | Type: {} | cpu: {} | mem: {}".format(c + 1,
-                                                                                       DEFAULT_CLUSTER_TYPES[type][
-                                                                                           'type'],
-                                                                                       self.cpu_capacity[c],
-                                                                                       self.memory_capacity[c]))
+
+        # Per-cluster resource arrays are views of the columns of _resources, only updated in place from here on
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Init] Resource Capacity calculation... ")
+        self._resources = np.zeros((num_clusters, len(RESOURCE_FIELDS)))
+        for i, field in enumerate(RESOURCE_FIELDS):
+            setattr(self, field, self._resources[:, i])
+        self.cluster_type = self.np_random.integers(low=0, high=NUM_CLUSTER_TYPES, size=num_clusters)
+        self._resources[:, CAPACITY] = CLUSTER_TABLE[self.cluster_type, :2]
+        self.cluster_cost = CLUSTER_TABLE[self.cluster_type, 2].copy()
+        # CPU usage percentage per allocated CPU unit
+        self._inv_cpu_capacity_pct = 100.0 / self.cpu_capacity
+        # Clusters are full above these amounts
+        np.multiply(heuristics_nb.FULL_THRESHOLD, self._resources[:, CAPACITY], out=self._resources[:, THRESHOLD])
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Init] Cluster Types: {} | cpu: {} | mem: {}".format(
+                self.cluster_type, self.cpu_capacity, self.memory_capacity))
 
         # Keeps track of allocated resources
-        self.allocated_cpu = self.np_random.uniform(low=0.0, high=0.2, size=num_clusters)
-        self.allocated_memory = self.np_random.uniform(low=0.0, high=0.2, size=num_clusters)
+        self.allocated_cpu[:] = self.np_random.uniform(low=0.0, high=0.2, size=num_clusters)
+        self.allocated_memory[:] = self.np_random.uniform(low=0.0, high=0.2, size=num_clusters)
 
         # Keeps track of Free resources for deployment requests
-        self.free_cpu = np.zeros(num_clusters)
-        self.free_memory = np.zeros(num_clusters)
-
-        for n in range(num_clusters):
-            self.free_cpu[n] = self.cpu_capacity[n] - self.allocated_cpu[n]
-            self.free_memory[n] = self.memory_capacity[n] - self.allocated_memory[n]
-
-        # Variables for divide strategy
-        self.split_number_replicas = np.zeros(num_clusters)
-        self.calculated_split_number_replicas = np.zeros(num_clusters)
-
-        '''
-        logging.info("[Init] Resources:")
-        logging.info("[Init] CPU Capacity: {}".format(self.cpu_capacity))
-        logging.info("[Init] CPU allocated: {}".format(self.allocated_cpu))
-        logging.info("[Init] CPU free: {}".format(self.free_cpu))
-        logging.info("[Init] MEM Capacity: {}".format(self.memory_capacity))
-        logging.info("[Init] MEM allocated: {}".format(self.allocated_memory))
-        logging.info("[Init] MEM free: {}".format(self.free_memory))
-        logging.info("[Init] Cluster Types: {}".format(self.cluster_type))
-        '''
+        np.subtract(self._resources[:, CAPACITY], self._resources[:, ALLOCATED], out=self._resources[:, FREE])
+        self.fill_static_state()
+
+        # Compile the spreading heuristics before the first step
+        heuristics_nb.warmup()
+
         # Variables for rewards
         self.latency_weight = latency_weight
         self.cost_weight = cost_weight
@@ -220,6 +265,7 @@ class KarmadaSchedulingEnv(gym.Env):
         self.accepted_requests = 0
         self.offered_requests = 0
         self.ep_accepted_requests = 0
+        self.draw_request_stream()
         self.next_request()
 
         # Info & episode over
@@ -228,17 +274,20 @@ class KarmadaSchedulingEnv(gym.Env):
         self.info = {}
         self.block_prob = 0
         self.ep_block_prob = 0
-        self.avg_latency = []
-        self.avg_cost = []
-        self.avg_cpu_usage_percentage_cluster_selected = []
+        # Running sums of latency, cost and cpu usage per accepted request
+        self.sum_latency = 0.0
+        self.sum_cost = 0.0
+        self.sum_cpu_usage_percentage_cluster_selected = 0.0
+        self.num_placements = 0
         self.avg_load_served = np.zeros(num_clusters)
+        self._gini = 0.0
+        self._gini_placements = -1
 
         # Keep track of spreading actions
         self.deploy_all = 0
         self.deploy_ffd = 0
         self.deploy_ffi = 0
         self.deploy_bf1b1 = 0
-        # self.deploy_nf1b1 = 0
 
         self.time_start = 0
         self.execution_time = 0
@@ -246,6 +295,15 @@ class KarmadaSchedulingEnv(gym.Env):
         self.file_results = file_results_name + ".csv"
         self.obs_csv = self.name + "_obs.csv"
 
+        # Observation csv, the writer is created on the first save
+        self._obs_fh = None
+        self._obs_writer = None
+        self._obs_rows = []
+
+        # Episode results are appended through a single handle, opened with the first finished episode
+        self._results_fh = None
+        self._results_writer = None
+
     # Reset Function
     def reset(self):
         """
@@ -263,70 +321,43 @@ class KarmadaSchedulingEnv(gym.Env):
         self.block_prob = 0
         self.ep_block_prob = 0
 
-        self.avg_latency = []
-        self.avg_cost = []
-        self.avg_load_served = np.zeros(self.num_clusters)
-        self.avg_cpu_usage_percentage_cluster_selected = []
-
-        # Reset Deployment Data
-        self.deploymentList = get_c2e_deployment_list()
-
-        for n1 in range(self.num_clusters):
-            for n2 in range(self.num_clusters):
-                if n1 == n2:  # for the same node assume 0
-                    self.latency_matrix[n1][n2] = 0
-                else:
-                    self.latency_matrix[n1][n2] = self.np_random.integers(low=MIN_DELAY, high=MAX_DELAY)
-
-            self.latency[n1] = mean(self.latency_matrix[n1])
-
-        logging.info("[Reset] Resource Capacity calculation... ")
-        self.cluster_type = [0] * self.num_clusters  # np.zeros(num_clusters)
-
-        for c in range(self.num_clusters):
-            type = int(self.np_random.integers(low=0, high=NUM_CLUSTER_TYPES))
-            self.cluster_type[c] = type
-            self.cpu_capacity[c] = DEFAULT_CLUSTER_TYPES[type]['cpu']
-            self.memory_capacity[c] = DEFAULT_CLUSTER_TYPES[type]['mem']
-            logging.info("[Init] Cluster id: {} | Type: {} | cpu: {} | mem: {}".format(c + 1,
-                                                                                       DEFAULT_CLUSTER_TYPES[type][
-                                                                                           'type'],
-                                                                                       self.cpu_capacity[c],
-                                                                                       self.memory_capacity[c]))
+        self.sum_latency = 0.0
+        self.sum_cost = 0.0
+        self.sum_cpu_usage_percentage_cluster_selected = 0.0
+        self.num_placements = 0
+        self.avg_load_served[:] = 0
+        self._gini_placements = -1
+
+        self.draw_latency_matrix()
+
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Reset] Resource Capacity calculation... ")
+        self.cluster_type = self.np_random.integers(low=0, high=NUM_CLUSTER_TYPES, size=self.num_clusters)
+        self._resources[:, CAPACITY] = CLUSTER_TABLE[self.cluster_type, :2]
+        self.cluster_cost[:] = CLUSTER_TABLE[self.cluster_type, 2]
+        np.divide(100.0, self.cpu_capacity, out=self._inv_cpu_capacity_pct)
+        np.multiply(heuristics_nb.FULL_THRESHOLD, self._resources[:, CAPACITY], out=self._resources[:, THRESHOLD])
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Reset] Cluster Types: {} | cpu: {} | mem: {}".format(
+                self.cluster_type, self.cpu_capacity, self.memory_capacity))
 
         # Keeps track of allocated resources
-        self.allocated_cpu = self.np_random.uniform(low=0.0, high=0.2, size=self.num_clusters)
-        self.allocated_memory = self.np_random.uniform(low=0.0, high=0.2, size=self.num_clusters)
-
-        self.free_cpu = np.zeros(self.num_clusters)
-        self.free_memory = np.zeros(self.num_clusters)
-        for n in range(self.num_clusters):
-            self.free_cpu[n] = self.cpu_capacity[n] - self.allocated_cpu[n]
-            self.free_memory[n] = self.memory_capacity[n] - self.allocated_memory[n]
-
-        '''
-        logging.info("[Reset] Resources:")
-        logging.info("[Reset] CPU Capacity: {}".format(self.cpu_capacity))
-        logging.info("[Reset] CPU allocated: {}".format(self.allocated_cpu))
-        logging.info("[Reset] CPU free: {}".format(self.free_cpu))
-        logging.info("[Reset] MEM Capacity: {}".format(self.memory_capacity))
-        logging.info("[Reset] MEM allocated: {}".format(self.allocated_memory))
-        logging.info("[Reset] MEM free: {}".format(self.free_memory))
-        '''
+        self.allocated_cpu[:] = self.np_random.uniform(low=0.0, high=0.2, size=self.num_clusters)
+        self.allocated_memory[:] = self.np_random.uniform(low=0.0, high=0.2, size=self.num_clusters)
+
+        np.subtract(self._resources[:, CAPACITY], self._resources[:, ALLOCATED], out=self._resources[:, FREE])
 
         # Keep track of spreading actions
         self.deploy_all = 0
         self.deploy_ffd = 0
         self.deploy_ffi = 0
         self.deploy_bf1b1 = 0
-        # self.deploy_nf1b1 = 0
 
-        # Variables for divide strategy
-        self.split_number_replicas = np.zeros(self.num_clusters)
-        self.calculated_split_number_replicas = np.zeros(self.num_clusters)
+        self.update_full_mask()
+        self.fill_static_state()
 
         # return obs
-        return np.array(self.get_state())
+        return self.get_state()
 
     # Step function
     def step(self, action):
@@ -336,6 +367,7 @@ class KarmadaSchedulingEnv(gym.Env):
         # Execute one time step within the environment
         self.offered_requests += 1
         self.take_action(action)
+        self.update_full_mask()
 
         # Calculate Reward
         reward = self.get_reward()
@@ -351,8 +383,9 @@ class KarmadaSchedulingEnv(gym.Env):
             move = ACTIONS[2]
 
         # Logging Step and Total Reward
-        logging.info('[Step {}] | Action: {} | Reward: {} | Total Reward: {}'.format(
-            self.current_step, move, reward, self.total_reward))
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info('[Step {}] | Action: {} | Reward: {} | Total Reward: {}'.format(
+                self.current_step, move, reward, self.total_reward))
 
         # Get next request
         self.next_request()
@@ -360,52 +393,41 @@ class KarmadaSchedulingEnv(gym.Env):
         # Update observation
         ob = self.get_state()
 
-        date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         # self.save_obs_to_csv(self.obs_csv, np.array(ob), date)
 
         # episode results to save
         self.block_prob = 1 - (self.accepted_requests / self.offered_requests)
         self.ep_block_prob = 1 - (self.ep_accepted_requests / self.current_step)
 
-        if len(self.avg_latency) == 0 and len(self.avg_cost) == 0 and len(
-                self.avg_cpu_usage_percentage_cluster_selected) == 0:
+        if self.num_placements == 0:
             avg_c = 1
             avg_l = 1
             avg_cpu = 1
         else:
-            avg_c = mean(self.avg_cost)
-            avg_l = mean(self.avg_latency)
-            avg_cpu = mean(self.avg_cpu_usage_percentage_cluster_selected)
-
-        self.info = {
-            "reward_step": float("{:.2f}".format(reward)),
-            "action": float("{:.2f}".format(action)),
-            # "block_prob": float("{:.2f}".format(self.block_prob)),
-            "reward": float("{:.2f}".format(self.total_reward)),
-            "ep_block_prob": float("{:.2f}".format(self.ep_block_prob)),
-            "ep_accepted_requests": float("{:.2f}".format(self.ep_accepted_requests)),
-            "ep_rejected_requests": float("{:.2f}".format(self.episode_length - self.ep_accepted_requests)),
-            "ep_deploy_all": float("{:.2f}".format(self.deploy_all)),
-            "ep_ffd": float("{:.2f}".format(self.deploy_ffd)),
-            "ep_ffi": float("{:.2f}".format(self.deploy_ffi)),
-            "ep_bf1b1": float("{:.2f}".format(self.deploy_bf1b1)),
-            # "ep_nf1b1": float("{:.2f}".format(self.deploy_nf1b1)),
-            'avg_latency': float("{:.2f}".format(avg_l)),
-            'avg_cost': float("{:.2f}".format(avg_c)),
-            'avg_cpu_cluster_selected': float("{:.2f}".format(avg_cpu)),
-            'gini': float("{:.2f}".format(calculate_gini_coefficient(self.avg_load_served))),
-            'executionTime': float("{:.2f}".format(self.execution_time))
-        }
+            avg_c = self.sum_cost / self.num_placements
+            avg_l = self.sum_latency / self.num_placements
+            avg_cpu = self.sum_cpu_usage_percentage_cluster_selected / self.num_placements
+
+        # A new info dict every step: vec envs add the terminal observation to the dict they get
+        # Values are listed in the order of INFO_KEYWORDS, the single definition of the info keys
+        values = (reward, action, self.total_reward, self.ep_block_prob, self.ep_accepted_requests,
+                  self.episode_length - self.ep_accepted_requests, self.deploy_all, self.deploy_ffd,
+                  self.deploy_ffi, self.deploy_bf1b1, avg_l, avg_c, avg_cpu, self.get_gini(), self.execution_time)
+        self.info = {key: round(float(value), 2) for key, value in zip(INFO_KEYWORDS, values)}
 
         if self.current_step == self.episode_length:
             self.episode_count += 1
             self.episode_over = True
             self.execution_time = time.time() - self.time_start
 
-            gini = calculate_gini_coefficient(self.avg_load_served)
+            gini = self.get_gini()
 
-            logging.info("[Step] Episode finished, saving results to csv...")
-            save_to_csv(self.file_results, self.episode_count,
+            if __debug__ and _log.isEnabledFor(logging.INFO):
+                _log.info("[Step] Episode finished, saving results to csv...")
+            if self._results_fh is None:
+                self.open_results_csv()
+            save_to_csv(self._results_writer, self.episode_count,
                         self.total_reward, self.ep_block_prob,
                         self.ep_accepted_requests,
                         self.episode_length - self.ep_accepted_requests,
@@ -413,133 +435,147 @@ class KarmadaSchedulingEnv(gym.Env):
                         self.deploy_ffd,
                         self.deploy_ffi,
                         self.deploy_bf1b1,
-                        # self.deploy_nf1b1,
-                        mean(self.avg_latency),
-                        mean(self.avg_cost),
-                        mean(self.avg_cpu_usage_percentage_cluster_selected),
+                        avg_l,
+                        avg_c,
+                        avg_cpu,
                         gini,
                         self.execution_time)
+            # Flushed row by row: results are kept if the process ends without close (e.g. subprocess workers)
+            self._results_fh.flush()
+            if self._obs_rows:
+                self.flush_obs_csv()
+
+            # The observation buffer is overwritten by the next reset, hand out the terminal one as a copy
+            ob = ob.copy()
 
         # return ob, reward, self.episode_over, self.info
-        return np.array(ob), reward, self.episode_over, self.info
+        return ob, reward, self.episode_over, self.info
 
     # TODO: Future work: design reward function based on Multi-Objective Function
     # Reward Function
     def get_reward(self):
         """ Calculate Rewards """
-        if self.reward_function == NAIVE:
-            if self.penalty:
-                if not self.check_if_cluster_is_really_full():
-                    logging.info("[NAIVE] Penalty = True, and resources "
-                                 "were available, penalize the agent...")
-                    return -1
-                else:  # agent should not be penalized
-                    logging.info("[NAIVE] Penalty = True, but resources "
-                                 "were not available, do not penalize the agent...")
-                    return 1
-            else:
+        return self._reward_fn()
+
+    # Naive Reward Function
+    def _reward_naive(self):
+        if self.penalty:
+            if not self.check_if_cluster_is_really_full():
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info("[NAIVE] Penalty = True, and resources "
+                              "were available, penalize the agent...")
+                return -1
+            else:  # agent should not be penalized
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info("[NAIVE] Penalty = True, but resources "
+                              "were not available, do not penalize the agent...")
                 return 1
-
-        # Multi-Objective Reward Function
-        elif self.reward_function == MULTI:
-            if self.penalty:
-                if not self.check_if_cluster_is_really_full():
-                    logging.info("[MULTI] Penalty = True, and resources "
-                                 "were available, penalize the agent...")
-                    return -1
-                else:  # agent should not be penalized
-                    logging.info("[MULTI] Penalty = True, but resources "
-                                 "were not available, do not penalize the agent...")
-                    return 1
-            else:  # If deployment is not split
-                lat = 0
-                cost = 0
-                if not self.deployment_request.is_deployment_split:
-                    logging.info('[MULTI] Deployment not split...')
-
-                    # Cost
-                    type_id = self.cluster_type[self.deployment_request.deployed_cluster]
-                    cost = DEFAULT_CLUSTER_TYPES[type_id]['cost']
-
-                    # Latency
-                    lat = self.latency[self.deployment_request.deployed_cluster]
-
-                else:  # If deployment is split
-                    logging.info('[MULTI] Deployment split...')
-                    # Cost
-                    cost = self.deployment_request.expected_cost
-
-                    # Latency
-                    lat = self.deployment_request.expected_latency
-
-                gini = calculate_gini_coefficient(self.avg_load_served)
-                logging.info('[Multi Reward] Latency: {} | Cost: {} | Gini: {} |'.format(lat, cost, gini))
-
-                lat = normalize(lat, MIN_DELAY, MAX_DELAY)
-                cost = normalize(cost, MIN_COST, MAX_COST)
-
-                reward = self.latency_weight * (1 - lat) + self.cost_weight * (1 - cost) + self.gini_weight * (1 - gini)
-
-                logging.info(
-                    '[Multi Reward] latency norm: {} | cost norm: {} | gini: {} | reward: {}'.format(lat, cost, gini,
-                                                                                                     reward))
-                logging.info('[Multi Reward] latency part: {} | cost part: {} | gini part: {}'.format(
-                    self.latency_weight * (1 - lat), self.cost_weight * (1 - cost), self.gini_weight * (1 - gini)))
-                return reward
-
-        # Latency Reward Function
-        elif self.reward_function == LATENCY:
-            logging.info('[Get Reward] Latency Reward Funtion Selected...')
-            if self.penalty:
-                if not self.check_if_cluster_is_really_full():
-                    logging.info("[Get Reward] Penalty = True, and resources "
-                                 "were available, penalize the agent...")
-                    return -1
-                else:  # agent should not be penalized
-                    logging.info("[Get Reward] Penalty = True, but resources "
-                                 "were not available, do not penalize the agent...")
-                    return 1
-            else:  # If deployment is not split
-                t = self.deployment_request.latency_threshold
-                lat = 0
-                if not self.deployment_request.is_deployment_split:
-                    lat = self.latency[self.deployment_request.deployed_cluster]
-                    logging.info('[Get Reward] Latency Reward All - Threshold: {} | latency: {}'.format(t, lat))
-
-                else:  # If deployment is split
-                    lat = self.deployment_request.expected_latency
-                    logging.info('[Get Reward] Latency Reward Divide - Threshold: {} | latency: {}'.format(t, lat))
-
-                if t > lat:
-                    return 1
-                else:
-                    return -1
-
-        # Cost-aware reward function
-        elif self.reward_function == COST:
-            logging.info('[Get Reward] Cost Reward Funtion Selected...')
-            if self.penalty:
-                if not self.check_if_cluster_is_really_full():
-                    logging.info("[Get Reward] Penalty = True, and resources "
-                                 "were available, penalize the agent...")
-                    return -1
-                else:  # agent should not be penalized
-                    logging.info("[Get Reward] Penalty = True, but resources "
-                                 "were not available, do not penalize the agent...")
-                    return MAX_COST - MIN_COST
-            else:  # If deployment is not split
-                if not self.deployment_request.is_deployment_split:
-                    c = self.deployment_request.deployed_cluster
-                    type_id = self.cluster_type[c]
-                    cost = DEFAULT_CLUSTER_TYPES[type_id]['cost']
-                    logging.info('[Get Reward] Cost Reward All - type_id {} - cost: {}'.format(type_id, cost))
-                else:  # If deployment is split
-                    cost = self.deployment_request.expected_cost
-                    logging.info('[Get Reward] Cost Reward Divide - cost: {}'.format(cost))
-
-                return float("{:.2f}".format(MAX_COST - cost))
         else:
-            logging.info('[Get Reward] Unrecognized reward: {}'.format(self.reward_function))
+            return 1
+
+    # Multi-Objective Reward Function
+    def _reward_multi(self):
+        if self.penalty:
+            if not self.check_if_cluster_is_really_full():
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info("[MULTI] Penalty = True, and resources "
+                              "were available, penalize the agent...")
+                return -1
+            else:  # agent should not be penalized
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info("[MULTI] Penalty = True, but resources "
+                              "were not available, do not penalize the agent...")
+                return 1
+        else:  # If deployment is not split
+            request = self.deployment_request
+            if not request.is_deployment_split:
+                # Cost
+                cost = self.cluster_cost[request.deployed_cluster]
+
+                # Latency
+                lat = self.latency[request.deployed_cluster]
+
+            else:  # If deployment is split
+                # Cost
+                cost = request.expected_cost
+
+                # Latency
+                lat = request.expected_latency
+
+            gini = self.get_gini()
+            if __debug__ and _log.isEnabledFor(logging.INFO):
+                _log.info('[Multi Reward] Latency: {} | Cost: {} | Gini: {} |'.format(lat, cost, gini))
+
+            lat = (lat - MIN_DELAY) * LATENCY_SCALE
+            cost = (cost - MIN_COST) * COST_SCALE
+
+            reward = self.latency_weight * (1 - lat) + self.cost_weight * (1 - cost) + self.gini_weight * (1 - gini)
+
+            return reward
+
+    # Latency Reward Function
+    def _reward_latency(self):
+        if self.penalty:
+            if not self.check_if_cluster_is_really_full():
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info("[Get Reward] Penalty = True, and resources "
+                              "were available, penalize the agent...")
+                return -1
+            else:  # agent should not be penalized
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info("[Get Reward] Penalty = True, but resources "
+                              "were not available, do not penalize the agent...")
+                return 1
+        else:  # If deployment is not split
+            request = self.deployment_request
+            t = request.latency_threshold
+            if not request.is_deployment_split:
+                lat = self.latency[request.deployed_cluster]
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info('[Get Reward] Latency Reward All - Threshold: {} | latency: {}'.format(t, lat))
+
+            else:  # If deployment is split
+                lat = request.expected_latency
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info('[Get Reward] Latency Reward Divide - Threshold: {} | latency: {}'.format(t, lat))
+
+            if t > lat:
+                return 1
+            else:
+                return -1
+
+    # Cost-aware reward function
+    def _reward_cost(self):
+        if self.penalty:
+            if not self.check_if_cluster_is_really_full():
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info("[Get Reward] Penalty = True, and resources "
+                              "were available, penalize the agent...")
+                return -1
+            else:  # agent should not be penalized
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info("[Get Reward] Penalty = True, but resources "
+                              "were not available, do not penalize the agent...")
+                return MAX_COST - MIN_COST
+        else:  # If deployment is not split
+            request = self.deployment_request
+            if not request.is_deployment_split:
+                c = request.deployed_cluster
+                cost = self.cluster_cost[c]
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info('[Get Reward] Cost Reward All - type_id {} - cost: {}'.format(self.cluster_type[c],
+                                                                                            cost))
+            else:  # If deployment is split
+                cost = request.expected_cost
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info('[Get Reward] Cost Reward Divide - cost: {}'.format(cost))
+
+            return round(float(MAX_COST - cost), 2)
+
+    # Fallback for unknown reward functions
+    def _reward_unrecognized(self):
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info('[Get Reward] Unrecognized reward: {}'.format(self.reward_function))
 
     def seed(self, seed=None):
         self.np_random, seed = seeding.np_random(seed)
@@ -549,922 +585,448 @@ class KarmadaSchedulingEnv(gym.Env):
         # Render the environment to the screen
         return
 
+    def close(self):
+        # Close the episode results and flush the buffered observations
+        self.close_results_csv()
+        self.close_obs_csv()
+
+    # Open the episode results file, kept open until close
+    # The finalizer only holds the file: it closes it if the env is collected or at exit, without keeping the env alive
+    def open_results_csv(self):
+        self._results_fh = open(self.file_results, 'a', newline='')
+        self._results_writer = csv.writer(self._results_fh)
+        self._results_finalizer = weakref.finalize(self, self._results_fh.close)
+
+    def close_results_csv(self):
+        if self._results_fh is not None:
+            self._results_finalizer()
+            self._results_fh = None
+            self._results_writer = None
+
     # Apply the action selected by the RL agent
     def take_action(self, action):
         self.current_step += 1
 
         # Stop if MAX_STEPS
         if self.current_step == self.episode_length:
-            # logging.info('[Take Action] MAX STEPS achieved, ending ...')
             self.episode_over = True
 
         # Possible Actions: Place all replicas together or split them.
         # Known as NP-hard problem (Bin pack with fragmentation)
         # Any ideas for heuristic? We can later compare with an ILP/MILP model...
-        # Check first if "Place all" Action can be performed
-        if action < self.num_clusters:
-            if self.check_if_cluster_is_full_after_full_deployment(action):
-                self.penalty = True
-                logging.info('[Take Action] Block the selected action since cluster will be full!')
-                # Do not raise error since algorithm might not support action mask
-                # raise ValueError("Action mask is not working properly. Full nodes should be always masked.")
-            else:
-                # accept request
-                self.accepted_requests += 1
-                self.ep_accepted_requests += 1
-                self.deploy_all += 1
-                self.deployment_request.deployed_cluster = action
-                self.penalty = False
-                # Update allocated amounts
-                self.allocated_cpu[action] += self.deployment_request.cpu_request * self.deployment_request.num_replicas
-                self.allocated_memory[
-                    action] += self.deployment_request.memory_request * self.deployment_request.num_replicas
-
-                self.avg_cpu_usage_percentage_cluster_selected.append(
-                    100 * (self.allocated_cpu[action] / self.cpu_capacity[action]))
-                self.avg_load_served[action] += self.deployment_request.num_replicas
-
-                # Update free resources
-                self.free_cpu[action] = self.cpu_capacity[action] - self.allocated_cpu[action]
-                self.free_memory[action] = self.memory_capacity[action] - self.allocated_memory[action]
-                self.enqueue_request(self.deployment_request)
-
-                # Latency and Cost updates
-                self.increase_latency(action, 1.15)  # 15% increase max
-                self.avg_latency.append(self.latency[action])
-                type_id = self.cluster_type[action]
-                self.avg_cost.append(DEFAULT_CLUSTER_TYPES[type_id]['cost'])
-
-                # Save expected latency and cost in deployment request
-                self.deployment_request.expected_latency = self.latency[action]
-                self.deployment_request.expected_cost = DEFAULT_CLUSTER_TYPES[type_id]['cost']
-
-        # FFD increasing Strategy
-        elif action == self.num_clusters + FFD:
-            if self.deployment_request.num_replicas == 1:
-                logging.info('[Take Action] Block FFD strategy since only one replica... ')
-                self.penalty = True
-            else:
-                logging.info('[Take Action] FFD strategy chosen... ')
-                div = self.first_fit_decreasing_heuristic(self.deployment_request.num_replicas,
-                                                          self.deployment_request.cpu_request,
-                                                          self.deployment_request.memory_request, self.num_clusters,
-                                                          self.free_cpu, self.free_memory)
-
-                if self.check_if_clusters_are_full_after_split_deployment(div):
-                    self.penalty = True
-                    logging.info('[Take Action] Block the FFD strategy since cluster will be full!')
-                else:
-                    # accept request
-                    self.penalty = False
-                    self.accepted_requests += 1
-                    self.ep_accepted_requests += 1
-                    self.deploy_ffd += 1
-                    self.deployment_request.split_clusters = div
-                    self.deployment_request.is_deployment_split = True
-
-                    # logging.info("[Divide] Before")
-                    # logging.info("[Divide] CPU allocated: {}".format(self.allocated_cpu))
-                    # logging.info("[Divide] CPU free: {}".format(self.free_cpu))
-                    # logging.info("[Divide] MEM allocated: {}".format(self.allocated_memory))
-                    # logging.info("[Divide] MEM free: {}".format(self.free_memory))
-
-                    avg_l = 0
-                    avg_c = 0
-                    avg_cpu = 0
-                    clusters = 0
-                    for d in range(len(div)):
-                        # Update allocated amounts
-                        self.allocated_cpu[d] += self.deployment_request.cpu_request * div[d]
-                        self.allocated_memory[d] += self.deployment_request.memory_request * div[d]
-                        avg_cpu += 100 * (self.allocated_cpu[d] / self.cpu_capacity[d])
-                        # Update free resources
-                        self.free_cpu[d] = self.cpu_capacity[d] - self.allocated_cpu[d]
-                        self.free_memory[d] = self.memory_capacity[d] - self.allocated_memory[d]
-
-                        # Latency updates
-                        avg_l += self.latency[d] * div[d]
-                        self.increase_latency(d, 1.05)  # 5% increase max for split
-
-                        # Cost Updates
-                        type_id = int(self.cluster_type[d])
-                        avg_c += DEFAULT_CLUSTER_TYPES[type_id]['cost'] * div[d]
-
-                        # Load updates
-                        self.avg_load_served[d] += div[d]
-
-                    avg_l = avg_l / self.deployment_request.num_replicas
-                    avg_c = avg_c / self.deployment_request.num_replicas
-                    avg_cpu = avg_cpu / self.deployment_request.num_replicas
-
-                    self.avg_latency.append(avg_l)
-                    self.avg_cost.append(avg_c)
-                    self.avg_cpu_usage_percentage_cluster_selected.append(avg_cpu)
-                    '''
-                    logging.info("[FFD] Average Latency: {}".format(avg_l))
-                    logging.info("[FFD] Average Cost: {}".format(avg_c))
-                    logging.info("[FFD] Average CPU: {}".format(avg_cpu))
-                    logging.info("[FFD] Average Load: {}".format(self.avg_load_served))                 
-                    '''
-
-                    # Save expected latency and cost in deployment request
-                    self.deployment_request.expected_latency = avg_l
-                    self.deployment_request.expected_cost = avg_c
-
-                    # logging.info("[Divide] After")
-                    # logging.info("[Divide] CPU allocated: {}".format(self.allocated_cpu))
-                    # logging.info("[Divide] CPU free: {}".format(self.free_cpu))
-
-                    # logging.info("[Divide] MEM allocated: {}".format(self.allocated_memory))
-                    # logging.info("[Divide] MEM free: {}".format(self.free_memory))
-                    self.enqueue_request(self.deployment_request)
-
-        # FFI decreasing strategy
-        elif action == self.num_clusters + FFI:
-            if self.deployment_request.num_replicas == 1:
-                logging.info('[Take Action] Block FFI strategy since only one replica... ')
-                self.penalty = True
-            else:
-                logging.info('[Take Action] Divide FFI chosen... ')
-                div = self.first_fit_decreasing_heuristic(self.deployment_request.num_replicas,
-                                                          self.deployment_request.cpu_request,
-                                                          self.deployment_request.memory_request,
-                                                          self.num_clusters,
-                                                          self.free_cpu, self.free_memory)
-
-                if self.check_if_clusters_are_full_after_split_deployment(div):
-                    self.penalty = True
-                    logging.info('[Take Action] Block the FFI strategy since cluster will be full!')
-                else:
-                    # accept request
-                    self.penalty = False
-                    self.accepted_requests += 1
-                    self.ep_accepted_requests += 1
-                    self.deploy_ffi += 1
-                    self.deployment_request.split_clusters = div
-                    self.deployment_request.is_deployment_split = True
-
-                    avg_l = 0
-                    avg_c = 0
-                    avg_cpu = 0
-                    clusters = 0
-                    for d in range(len(div)):
-                        # Update allocated amounts
-                        self.allocated_cpu[d] += self.deployment_request.cpu_request * div[d]
-                        self.allocated_memory[d] += self.deployment_request.memory_request * div[d]
-                        avg_cpu += 100 * (self.allocated_cpu[d] / self.cpu_capacity[d])
-                        # Update free resources
-                        self.free_cpu[d] = self.cpu_capacity[d] - self.allocated_cpu[d]
-                        self.free_memory[d] = self.memory_capacity[d] - self.allocated_memory[d]
-
-                        # Latency updates
-                        avg_l += self.latency[d] * div[d]
-                        self.increase_latency(d, 1.05)  # 5% increase max for split
-
-                        # Cost Updates
-                        type_id = int(self.cluster_type[d])
-                        avg_c += DEFAULT_CLUSTER_TYPES[type_id]['cost'] * div[d]
-
-                        # Load updates
-                        self.avg_load_served[d] += div[d]
-
-                    avg_l = avg_l / self.deployment_request.num_replicas
-                    avg_c = avg_c / self.deployment_request.num_replicas
-                    avg_cpu = avg_cpu / self.deployment_request.num_replicas
-
-                    self.avg_latency.append(avg_l)
-                    self.avg_cost.append(avg_c)
-                    self.avg_cpu_usage_percentage_cluster_selected.append(avg_cpu)
-
-                    # Save expected latency and cost in deployment request
-                    self.deployment_request.expected_latency = avg_l
-                    self.deployment_request.expected_cost = avg_c
-
-                    # logging.info("[Divide] After")
-                    # logging.info("[Divide] CPU allocated: {}".format(self.allocated_cpu))
-                    # logging.info("[Divide] CPU free: {}".format(self.free_cpu))
-
-                    # logging.info("[Divide] MEM allocated: {}".format(self.allocated_memory))
-                    # logging.info("[Divide] MEM free: {}".format(self.free_memory))
-                    self.enqueue_request(self.deployment_request)
-        # BF1B1 spreading strategy
-        elif action == self.num_clusters + BF1B1:
-            if self.deployment_request.num_replicas == 1:
-                logging.info('[Take Action] Block BF1B1 strategy since only one replica... ')
-                self.penalty = True
-            else:
-                logging.info('[Take Action] BF1B1 chosen... ')
-                div = self.best_fit_heuristic_one_by_one(self.deployment_request.num_replicas,
-                                                         self.deployment_request.cpu_request,
-                                                         self.deployment_request.memory_request,
-                                                         self.num_clusters,
-                                                         self.free_cpu, self.free_memory)
-
-                if self.check_if_clusters_are_full_after_split_deployment(div):
-                    self.penalty = True
-                    logging.info('[Take Action] Block the BF1B1 strategy since cluster will be full!')
-                else:
-                    # accept request
-                    self.penalty = False
-                    self.accepted_requests += 1
-                    self.ep_accepted_requests += 1
-                    self.deploy_bf1b1 += 1
-                    self.deployment_request.split_clusters = div
-                    self.deployment_request.is_deployment_split = True
-
-                    # logging.info("[Divide] Before")
-                    # logging.info("[Divide] CPU allocated: {}".format(self.allocated_cpu))
-                    # logging.info("[Divide] CPU free: {}".format(self.free_cpu))
-                    # logging.info("[Divide] MEM allocated: {}".format(self.allocated_memory))
-                    # logging.info("[Divide] MEM free: {}".format(self.free_memory))
-
-                    avg_l = 0
-                    avg_c = 0
-                    avg_cpu = 0
-                    clusters = 0
-                    for d in range(len(div)):
-                        # Update allocated amounts
-                        self.allocated_cpu[d] += self.deployment_request.cpu_request * div[d]
-                        self.allocated_memory[d] += self.deployment_request.memory_request * div[d]
-                        avg_cpu += 100 * (self.allocated_cpu[d] / self.cpu_capacity[d])
-                        # Update free resources
-                        self.free_cpu[d] = self.cpu_capacity[d] - self.allocated_cpu[d]
-                        self.free_memory[d] = self.memory_capacity[d] - self.allocated_memory[d]
-
-                        # Latency updates
-                        avg_l += self.latency[d] * div[d]
-                        self.increase_latency(d, 1.05)  # 5% increase max for split
-
-                        # Cost Updates
-                        type_id = int(self.cluster_type[d])
-                        avg_c += DEFAULT_CLUSTER_TYPES[type_id]['cost'] * div[d]
-
-                        # Load updates
-                        self.avg_load_served[d] += div[d]
-
-                    avg_l = avg_l / self.deployment_request.num_replicas
-                    avg_c = avg_c / self.deployment_request.num_replicas
-                    avg_cpu = avg_cpu / self.deployment_request.num_replicas
-
-                    self.avg_latency.append(avg_l)
-                    self.avg_cost.append(avg_c)
-                    self.avg_cpu_usage_percentage_cluster_selected.append(avg_cpu)
-
-                    # logging.info("[BF1B1] Average Latency: {}".format(avg_l))
-                    # logging.info("[BF1B1] Average Cost: {}".format(avg_c))
-                    # logging.info("[BF1B1] Average CPU: {}".format(avg_cpu))
-                    # logging.info("[BF1B1] Average Load: {}".format(self.avg_load_served))
-
-                    # Save expected latency and cost in deployment request
-                    self.deployment_request.expected_latency = avg_l
-                    self.deployment_request.expected_cost = avg_c
-                    self.enqueue_request(self.deployment_request)
-
-        # Reject the request: give the agent a penalty, especially if the request could have been accepted
-        elif action == self.num_clusters + NUM_SPREADING_ACTIONS:
+        if 0 <= action < self.num_actions:
+            handler, arg = self._action_table[action]
+            handler(arg)
+        else:
+            if __debug__ and _log.isEnabledFor(logging.INFO):
+                _log.info('[Take Action] Unrecognized Action: {}'.format(action))
+
+    # Check first if "Place all" Action can be performed
+    def deploy_all_replicas(self, action):
+        request = self.deployment_request
+        if self.check_if_cluster_is_full_after_full_deployment(action):
+            self.penalty = True
+            if __debug__ and _log.isEnabledFor(logging.INFO):
+                _log.info('[Take Action] Block the selected action since cluster will be full!')
+            # Do not raise error since algorithm might not support action mask
+            # raise ValueError("Action mask is not working properly. Full nodes should be always masked.")
+        else:
+            # accept request
+            self.accepted_requests += 1
+            self.ep_accepted_requests += 1
+            self.deploy_all += 1
+            request.deployed_cluster = action
+            self.penalty = False
+            # Update allocated and free amounts together
+            delta_cpu = request.cpu_request * request.num_replicas
+            delta_memory = request.memory_request * request.num_replicas
+            self.allocated_cpu[action] += delta_cpu
+            self.free_cpu[action] -= delta_cpu
+            self.allocated_memory[action] += delta_memory
+            self.free_memory[action] -= delta_memory
+
+            self.sum_cpu_usage_percentage_cluster_selected += (self.allocated_cpu[action] *
+                                                               self._inv_cpu_capacity_pct[action])
+            self.avg_load_served[action] += request.num_replicas
+            self.enqueue_request(request)
+
+            # Latency and Cost updates
+            self.increase_latency(action, FULL_LATENCY_FACTOR)
+            latency = self.latency[action]
+            cost = self.cluster_cost[action]
+            self.sum_latency += latency
+            self.sum_cost += cost
+            self.num_placements += 1
+
+            # Save expected latency and cost in deployment request
+            request.expected_latency = latency
+            request.expected_cost = cost
+
+    # Spreading strategies: FFD, FFI and BF1B1
+    def deploy_split_replicas(self, strategy):
+        name, heuristic, counter = self._split_heuristics[strategy]
+        request = self.deployment_request
+        if request.num_replicas == 1:
+            if __debug__ and _log.isEnabledFor(logging.INFO):
+                _log.info('[Take Action] Block {} strategy since only one replica... '.format(name))
             self.penalty = True
         else:
-            logging.info('[Take Action] Unrecognized Action: {}'.format(action))
+            if __debug__ and _log.isEnabledFor(logging.INFO):
+                _log.info('[Take Action] {} strategy chosen... '.format(name))
+            div = heuristic(request.num_replicas, request.cpu_request, request.memory_request, self.num_clusters,
+                            self.free_cpu, self.free_memory)
 
-        '''
-        # BF1B1 spreading strategy
-        elif action == self.num_clusters + BF1B1:
-            if self.deployment_request.num_replicas == 1:
-                logging.info('[Take Action] Block BF1B1 strategy since only one replica... ')
+            if self.check_if_clusters_are_full_after_split_deployment(div):
                 self.penalty = True
+                if __debug__ and _log.isEnabledFor(logging.INFO):
+                    _log.info('[Take Action] Block the {} strategy since cluster will be full!'.format(name))
             else:
-                logging.info('[Take Action] BF1B1 chosen... ')
-                div = self.best_fit_heuristic_one_by_one(self.deployment_request.num_replicas,
-                                                                 self.deployment_request.cpu_request,
-                                                                 self.deployment_request.memory_request,
-                                                                 self.num_clusters,
-                                                                 self.free_cpu, self.free_memory)
-
-                if self.check_if_clusters_are_full_after_split_deployment(div):
-                        self.penalty = True
-                        logging.info('[Take Action] Block the BF1B1 strategy since cluster will be full!')
-                else:
-                    # accept request
-                    self.penalty = False
-                    self.accepted_requests += 1
-                    self.ep_accepted_requests += 1
-                    self.deploy_bf1b1 += 1
-                    self.deployment_request.split_clusters = div
-                    self.deployment_request.is_deployment_split = True
-
-                    # logging.info("[Divide] Before")
-                    # logging.info("[Divide] CPU allocated: {}".format(self.allocated_cpu))
-                    # logging.info("[Divide] CPU free: {}".format(self.free_cpu))
-                    # logging.info("[Divide] MEM allocated: {}".format(self.allocated_memory))
-                    # logging.info("[Divide] MEM free: {}".format(self.free_memory))
-
-                    avg_l = 0
-                    avg_c = 0
-                    avg_cpu = 0
-                    clusters = 0
-                    for d in range(len(div)):
-                        # Update allocated amounts
-                        self.allocated_cpu[d] += self.deployment_request.cpu_request * div[d]
-                        self.allocated_memory[d] += self.deployment_request.memory_request * div[d]
-                        avg_cpu += 100 * (self.allocated_cpu[d] / self.cpu_capacity[d])
-                        # Update free resources
-                        self.free_cpu[d] = self.cpu_capacity[d] - self.allocated_cpu[d]
-                        self.free_memory[d] = self.memory_capacity[d] - self.allocated_memory[d]
-
-                        # Latency updates
-                        avg_l += self.latency[d] * div[d]
-                        self.increase_latency(d, 1.05)  # 5% increase max for split
-
-                        # Cost Updates
-                        type_id = int(self.cluster_type[d])
-                        avg_c += DEFAULT_CLUSTER_TYPES[type_id]['cost'] * div[d]
-
-                        # Load updates
-                        self.avg_load_served[d] += div[d]
-
-                    avg_l = avg_l / self.deployment_request.num_replicas
-                    avg_c = avg_c / self.deployment_request.num_replicas
-                    avg_cpu = avg_cpu / self.deployment_request.num_replicas
-
-                    self.avg_latency.append(avg_l)
-                    self.avg_cost.append(avg_c)
-                    self.avg_cpu_usage_percentage_cluster_selected.append(avg_cpu)
-
-                    logging.info("[BF1B1] Average Latency: {}".format(avg_l))
-                    logging.info("[BF1B1] Average Cost: {}".format(avg_c))
-                    logging.info("[BF1B1] Average CPU: {}".format(avg_cpu))
-                    logging.info("[BF1B1] Average Load: {}".format(self.avg_load_served))
-
-                    # Save expected latency and cost in deployment request
-                    self.deployment_request.expected_latency = avg_l
-                    self.deployment_request.expected_cost = avg_c
-
-                    # logging.info("[Divide] After")
-                    # logging.info("[Divide] CPU allocated: {}".format(self.allocated_cpu))
-                    # logging.info("[Divide] CPU free: {}".format(self.free_cpu))
-
-                    # logging.info("[Divide] MEM allocated: {}".format(self.allocated_memory))
-                    # logging.info("[Divide] MEM free: {}".format(self.free_memory))
-                    self.enqueue_request(self.deployment_request)
-
-                # NF1B1 spreading strategy
-                elif action == self.num_clusters + NF1B1:
-                    if self.deployment_request.num_replicas == 1:
-                        logging.info('[Take Action] Block NF1B1 strategy since only one replica... ')
-                        self.penalty = True
-                    else:
-                        logging.info('[Take Action] NF1B1 chosen... ')
-                        div = self.best_fit_decreasing_heuristic(self.deployment_request.num_replicas,
-                                                                 self.deployment_request.cpu_request,
-                                                                 self.deployment_request.memory_request, self.num_clusters,
-                                                                 self.free_cpu, self.free_memory)
-
-                        if self.check_if_clusters_are_full_after_split_deployment(div):
-                            self.penalty = True
-                            logging.info('[Take Action] Block the NF1B1 strategy since cluster will be full!')
-                        else:
-                            # accept request
-                            self.penalty = False
-                            self.accepted_requests += 1
-                            self.ep_accepted_requests += 1
-                            self.deploy_nf1b1 += 1
-                            self.deployment_request.split_clusters = div
-                            self.deployment_request.is_deployment_split = True
-
-                            # logging.info("[Divide] Before")
-                            # logging.info("[Divide] CPU allocated: {}".format(self.allocated_cpu))
-                            # logging.info("[Divide] CPU free: {}".format(self.free_cpu))
-                            # logging.info("[Divide] MEM allocated: {}".format(self.allocated_memory))
-                            # logging.info("[Divide] MEM free: {}".format(self.free_memory))
-
-                            avg_l = 0
-                            avg_c = 0
-                            avg_cpu = 0
-                            clusters = 0
-                            for d in range(len(div)):
-                                # Update allocated amounts
-                                self.allocated_cpu[d] += self.deployment_request.cpu_request * div[d]
-                                self.allocated_memory[d] += self.deployment_request.memory_request * div[d]
-                                avg_cpu += 100 * (self.allocated_cpu[d] / self.cpu_capacity[d])
-                                # Update free resources
-                                self.free_cpu[d] = self.cpu_capacity[d] - self.allocated_cpu[d]
-                                self.free_memory[d] = self.memory_capacity[d] - self.allocated_memory[d]
-
-                                # Latency updates
-                                avg_l += self.latency[d] * div[d]
-                                self.increase_latency(d, 1.05)  # 5% increase max for split
-
-                                # Cost Updates
-                                type_id = int(self.cluster_type[d])
-                                avg_c += DEFAULT_CLUSTER_TYPES[type_id]['cost'] * div[d]
-
-                                # Load updates
-                                self.avg_load_served[d] += div[d]
-
-                            avg_l = avg_l / self.deployment_request.num_replicas
-                            avg_c = avg_c / self.deployment_request.num_replicas
-                            avg_cpu = avg_cpu / self.deployment_request.num_replicas
-
-                            self.avg_latency.append(avg_l)
-                            self.avg_cost.append(avg_c)
-                            self.avg_cpu_usage_percentage_cluster_selected.append(avg_cpu)
-
-                            logging.info("[NF1B1] Average Latency: {}".format(avg_l))
-                            logging.info("[NF1B1] Average Cost: {}".format(avg_c))
-                            logging.info("[NF1B1] Average CPU: {}".format(avg_cpu))
-                            logging.info("[NF1B1] Average Load: {}".format(self.avg_load_served))
-
-                            # Save expected latency and cost in deployment request
-                            self.deployment_request.expected_latency = avg_l
-                            self.deployment_request.expected_cost = avg_c
-
-                            # logging.info("[Divide] After")
-                            # logging.info("[Divide] CPU allocated: {}".format(self.allocated_cpu))
-                            # logging.info("[Divide] CPU free: {}".format(self.free_cpu))
-
-                            # logging.info("[Divide] MEM allocated: {}".format(self.allocated_memory))
-                            # logging.info("[Divide] MEM free: {}".format(self.free_memory))
-                            self.enqueue_request(self.deployment_request)
-                '''
+                self._apply_split(div, counter)
 
-    # Current Strategy: First Fit Decreasing (FFD)
-    def first_fit_decreasing_heuristic(self, num_replicas, cpu_req, mem_req, num_clusters, free_cpu, free_mem):
-        logging.info('[first_fit_decreasing_heuristic] Num. replicas to distribute: {}'.format(num_replicas))
-        distribution = [0] * num_clusters
-
-        # min and max replicas
-        min_replicas = 1
-        max_replicas = num_replicas
-
-        # Distribute the replicas across clusters
-        for n in range(num_clusters):
-            self.split_number_replicas[n] = min(free_cpu[n] / cpu_req,
-                                                free_mem[n] / mem_req)
-
-        # logging.info('[Take Action] Split factors: {}'.format(self.split_number_replicas))
-        min_factor = int(math.ceil(min(self.split_number_replicas)))
-        if min_factor >= max_replicas:
-            min_factor = max_replicas - 1  # To really distribute at the end
-
-        # logging.info('[Take Action] Min factor: {}'.format(min_factor))
-        # Sort the clusters by their remaining capacity (CPU) in decreasing order
-        sorted_clusters_cpu = {}
-        for n in range(num_clusters):
-            sorted_clusters_cpu[str(n)] = free_cpu[n]
-
-        sorted_clusters_cpu = sort_dict_by_value(sorted_clusters_cpu, reverse=True)
-
-        for key, value in sorted_clusters_cpu.items():
-            n = int(key)
-            if num_replicas == 0:
-                break
-            if num_replicas > 0 and min_factor < num_replicas and (
-                    (cpu_req * min_factor < value) and (mem_req * min_factor < free_mem[n])):
-                distribution[n] += min_factor
-                num_replicas -= min_factor
-            elif num_replicas > 0 and ((cpu_req < value) and (mem_req < free_mem[n])):
-                distribution[n] += min_replicas
-                num_replicas -= min_replicas
-
-        # Still distribute remaining replicas if needed
-        if num_replicas == 0:
-            logging.info('[first_fit_decreasing_heuristic] Replicas division: {}'.format(distribution))
-            return distribution
-        else:
-            logging.info('[first_fit_decreasing_heuristic] Replicas still to distribute...')
-            for n in range(num_clusters):
-                if num_replicas == 0:
-                    break
+    # Reject the request: give the agent a penalty, especially if the request could have been accepted
+    def reject_request(self, _):
+        self.penalty = True
 
-                if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
-                    distribution[n] += min_replicas
-                    num_replicas -= min_replicas
+    # Accept a split deployment: place the replicas of div across the clusters
+    def _apply_split(self, div, counter):
+        self.penalty = False
+        self.accepted_requests += 1
+        self.ep_accepted_requests += 1
+        setattr(self, counter, getattr(self, counter) + 1)
+        request = self.deployment_request
+        request.split_clusters = div
+        request.is_deployment_split = True
+
+        replicas = request.num_replicas
+        # Float copy of the replica counts, so the products and dot products below stay in float64
+        weights = div.astype(np.float64)
+
+        # Update allocated and free amounts together
+        delta_cpu = request.cpu_request * weights
+        delta_memory = request.memory_request * weights
+        self.allocated_cpu += delta_cpu
+        self.free_cpu -= delta_cpu
+        self.allocated_memory += delta_memory
+        self.free_memory -= delta_memory
+
+        # Latency, Cost and CPU usage weighted by the replicas placed on each cluster
+        avg_l = float(np.dot(self.latency, weights)) / replicas
+        avg_c = float(np.dot(self.cluster_cost, weights)) / replicas
+        avg_cpu = float(np.dot(self.allocated_cpu * self._inv_cpu_capacity_pct, weights)) / replicas
+
+        # Latency updates: only where replicas were placed
+        self.increase_latency_batch(np.flatnonzero(div), SPLIT_LATENCY_FACTOR)
+
+        # Load updates
+        self.avg_load_served += weights
+
+        self.sum_latency += avg_l
+        self.sum_cost += avg_c
+        self.sum_cpu_usage_percentage_cluster_selected += avg_cpu
+        self.num_placements += 1
+
+        # Save expected latency and cost in deployment request
+        request.expected_latency = avg_l
+        request.expected_cost = avg_c
+        self.enqueue_request(request)
 
-            logging.info('[first_fit_decreasing_heuristic] Replicas division: {}'.format(distribution))
-            return distribution
+    # Current Strategy: First Fit Decreasing (FFD)
+    def first_fit_decreasing_heuristic(self, num_replicas, cpu_req, mem_req, num_clusters, free_cpu, free_mem):
+        distribution = heuristics_nb.first_fit_decreasing(int(num_replicas), float(cpu_req), float(mem_req),
+                                                          free_cpu, free_mem)
+        if __debug__ and _log.isEnabledFor(logging.DEBUG):
+            _log.debug('[first_fit_decreasing_heuristic] Replicas: {} | division: {}'.format(num_replicas,
+                                                                                              distribution))
+        return distribution
 
     # Current Strategy: First Fit Increasing (FFI)
     def first_fit_increasing_heuristic(self, num_replicas, cpu_req, mem_req, num_clusters, free_cpu, free_mem):
-        logging.info('[Divide] Num. replicas to distribute: {}'.format(num_replicas))
-        distribution = [0] * num_clusters
-
-        # Calculate split factors
-        split_factors = [min(free_cpu[n] / cpu_req, free_mem[n] / mem_req) for n in range(num_clusters)]
-
-        # Calculate minimum factor
-        min_factor = int(math.ceil(min(split_factors)))
-        if min_factor >= num_replicas:
-            min_factor = num_replicas - 1  # To really distribute at the end
-
-        # Sort the clusters by their remaining capacity (CPU) in increasing order
-        sorted_clusters_cpu = sorted(range(num_clusters), key=lambda x: free_cpu[x])
-
-        for n in sorted_clusters_cpu:
-            if num_replicas == 0:
-                break
-
-            if num_replicas > 0 and min_factor < num_replicas and (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
-                distribution[n] += min_factor
-                num_replicas -= min_factor
-
-        # Still distribute remaining replicas if needed
-        if num_replicas > 0:
-            logging.info('[Divide] Replicas still to distribute...')
-            for n in range(num_clusters):
-                if num_replicas == 0:
-                    break
-
-                if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
-                    distribution[n] += 1
-                    num_replicas -= 1
-
-        logging.info('[Divide] Replicas division: {}'.format(distribution))
+        distribution = heuristics_nb.first_fit_increasing(int(num_replicas), float(cpu_req), float(mem_req),
+                                                          free_cpu, free_mem)
+        if __debug__ and _log.isEnabledFor(logging.DEBUG):
+            _log.debug('[first_fit_increasing_heuristic] Replicas: {} | division: {}'.format(num_replicas,
+                                                                                              distribution))
         return distribution
 
     def best_fit_heuristic_one_by_one(self, num_replicas, cpu_req, mem_req, num_clusters, free_cpu, free_mem):
-        logging.info('[best_fit_heuristic_one_by_one] Num. replicas to distribute: {}'.format(num_replicas))
-        distribution = [0] * num_clusters
-
-        # Distribute the replicas across clusters
-        for _ in range(num_replicas):
-            # Sort the clusters by their remaining capacity (CPU) in increasing order
-            sorted_clusters_cpu = sorted(range(num_clusters), key=lambda x: free_cpu[x])
-
-            best_fit_bin = None
-            best_fit_space = float('inf')
-
-            for cluster_idx in sorted_clusters_cpu:
-                if free_cpu[cluster_idx] >= cpu_req and free_mem[cluster_idx] >= mem_req:
-                    space = free_cpu[cluster_idx] - cpu_req + free_mem[cluster_idx] - mem_req
-                    if space < best_fit_space:
-                        best_fit_bin = cluster_idx
-                        best_fit_space = space
-
-            if best_fit_bin is not None:
-                distribution[best_fit_bin] += 1
-                free_cpu[best_fit_bin] -= cpu_req
-                free_mem[best_fit_bin] -= mem_req
-
-        logging.info('[best_fit_heuristic_one_by_one] Replicas division: {}'.format(distribution))
-        return distribution
-
-    '''
-    def best_fit_decreasing_heuristic(self, num_replicas, cpu_req, mem_req, num_clusters, free_cpu, free_mem):
-        logging.info('[best_fit_heuristic] Num. replicas to distribute: {}'.format(num_replicas))
-        distribution = [0] * num_clusters
-
-        # min and max replicas
-        min_replicas = 1
-        max_replicas = num_replicas
-
-        # Distribute the replicas across clusters
-        for n in range(num_clusters):
-            self.split_number_replicas[n] = min(free_cpu[n] / cpu_req,
-                                                free_mem[n] / mem_req)
-
-        # logging.info('[Take Action] Split factors: {}'.format(self.split_number_replicas))
-        min_factor = int(math.ceil(min(self.split_number_replicas)))
-        if min_factor >= max_replicas:
-            min_factor = max_replicas - 1  # To really distribute at the end
-
-        # logging.info('[Take Action] Min factor: {}'.format(min_factor))
-        # Sort the clusters by their remaining capacity (CPU) in decreasing order
-        sorted_clusters_cpu = {}
-        for n in range(num_clusters):
-            sorted_clusters_cpu[str(n)] = free_cpu[n]
-
-        sorted_clusters_cpu = sort_dict_by_value(sorted_clusters_cpu, reverse=True)
-
-        for key, value in sorted_clusters_cpu.items():
-            n = int(key)
-            if num_replicas == 0:
-                break
-            if num_replicas > 0 and min_factor < num_replicas and (
-                    (cpu_req * min_factor < value) and (mem_req * min_factor < free_mem[n])):
-                distribution[n] += min_factor
-                num_replicas -= min_factor
-            elif num_replicas > 0 and ((cpu_req < value) and (mem_req < free_mem[n])):
-                best_fit_bin = None
-                best_fit_space = float('inf')
-                for cluster_idx in range(num_clusters):
-                    if free_cpu[cluster_idx] >= cpu_req and free_mem[cluster_idx] >= mem_req:
-                        space = free_cpu[cluster_idx] - cpu_req + free_mem[cluster_idx] - mem_req
-                        if space < best_fit_space:
-                            best_fit_bin = cluster_idx
-                            best_fit_space = space
-                if best_fit_bin is not None:
-                    distribution[best_fit_bin] += min_replicas
-                    num_replicas -= min_replicas
-
-        # Still distribute remaining replicas if needed
-        if num_replicas == 0:
-            logging.info('[best_fit_heuristic] Replicas division: {}'.format(distribution))
-            return distribution
-        else:
-            logging.info('[best_fit_heuristic] Replicas still to distribute...')
-            for n in range(num_clusters):
-                if num_replicas == 0:
-                    break
-
-                if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
-                    distribution[n] += min_replicas
-                    num_replicas -= min_replicas
-
-            logging.info('[best_fit_heuristic] Replicas division: {}'.format(distribution))
-            return distribution
-    
-
-    def next_fit_heuristic_one_by_one(self, num_replicas, cpu_req, mem_req, num_clusters, free_cpu, free_mem):
-        logging.info('[next_fit_heuristic_one_by_one] Num. replicas to distribute: {}'.format(num_replicas))
-        distribution = [0] * num_clusters
-
-        # Index to keep track of the last used bin
-        last_bin_idx = 0
-
-        # Distribute the replicas across clusters
-        for _ in range(num_replicas):
-            # Find the next bin to use starting from the last used bin
-            for _ in range(num_clusters):
-                cluster_idx = (last_bin_idx + 1) % num_clusters
-                if free_cpu[cluster_idx] >= cpu_req and free_mem[cluster_idx] >= mem_req:
-                    distribution[cluster_idx] += 1
-                    free_cpu[cluster_idx] -= cpu_req
-                    free_mem[cluster_idx] -= mem_req
-                    last_bin_idx = cluster_idx
-                    break
-
-        logging.info('[next_fit_heuristic_one_by_one] Replicas division: {}'.format(distribution))
+        distribution = heuristics_nb.best_fit_1b1(int(num_replicas), float(cpu_req), float(mem_req),
+                                                  free_cpu, free_mem)
+        if __debug__ and _log.isEnabledFor(logging.DEBUG):
+            _log.debug('[best_fit_heuristic_one_by_one] Replicas: {} | division: {}'.format(num_replicas,
+                                                                                             distribution))
         return distribution
-    '''
 
     def get_state(self):
-        # Get Observation state
-        cluster = np.full(shape=(NUM_SPREADING_ACTIONS + 1, NUM_METRICS_CLUSTER + 1), fill_value=-1)
+        # Get Observation state, written in place into the preallocated buffer
+        obs = self._obs_buf
+        n = self.num_clusters
 
-        observation = np.stack([self.allocated_cpu,
-                                self.cpu_capacity,
-                                self.allocated_memory,
-                                self.memory_capacity,
-                                self.latency],
-                               axis=1)
+        # Capacities and the rows without cluster metrics are written by fill_static_state
+        obs[:n, 0] = self.allocated_cpu
+        obs[:n, 2] = self.allocated_memory
+        obs[:n, 4] = self.latency
 
         # Condition the elements in the set with the current node request
-        request_demands = np.tile(
-            np.array(
-                [self.deployment_request.num_replicas,
-                 self.deployment_request.cpu_request,
-                 self.deployment_request.memory_request,
-                 self.deployment_request.latency_threshold,
-                 self.dt]
-            ),
-            (self.num_clusters + NUM_SPREADING_ACTIONS + 1, 1),
-        )
-        '''
-        logging.info('[Get State]: cluster: {}'.format(cluster))
-        logging.info('[Get State]: cluster shape: {}'.format(cluster.shape))
-        logging.info('[Get State]: observation: {}'.format(observation))
-        logging.info('[Get State]: observation shape: {}'.format(observation.shape))
-        logging.info('[Get State]: request demands: {}'.format(request_demands))
-        logging.info('[Get State]: request demands shape: {}'.format(request_demands.shape))
-        '''
-        observation = np.concatenate([observation, cluster], axis=0)
-        # logging.info('[Get State]: concatenation: {}'.format(observation))
-        # logging.info('[Get State]: concatenation shape: {}'.format(observation.shape))
-
-        observation = np.concatenate([observation, request_demands], axis=1)
-        # logging.info('[Get State]: concatenation: {}'.format(observation))
-        # logging.info('[Get State]: concatenation shape: {}'.format(observation.shape))
-
-        return observation
+        request = self.deployment_request
+        obs[:, NUM_METRICS_CLUSTER + 1:] = (request.num_replicas, request.cpu_request, request.memory_request,
+                                            request.latency_threshold, self.dt)
+        return obs
 
-    # Save observation to csv file
-    def save_obs_to_csv(self, obs_file, obs, date):
-        file = open(obs_file, 'a+', newline='')  # append
-        # file = open(file_name, 'w', newline='') # new
-        fields = []
-        cluster_obs = {}
-        with file:
-            fields.append('date')
-            for n in range(self.num_clusters):
-                fields.append("cluster_" + str(n + 1) + '_allocated_cpu')
-                fields.append("cluster_" + str(n + 1) + '_cpu_capacity')
-                fields.append("cluster_" + str(n + 1) + '_allocated_memory')
-                fields.append("cluster_" + str(n + 1) + '_memory_capacity')
-                fields.append("cluster_" + str(n + 1) + '_num_replicas')
-                fields.append("cluster_" + str(n + 1) + '_cpu_request')
-                fields.append("cluster_" + str(n + 1) + '_memory_request')
-                fields.append("cluster_" + str(n + 1) + '_dt')
-
-            # logging.info("[Save Obs] fields: {}".format(fields))
-
-            writer = csv.DictWriter(file, fieldnames=fields)
-            # writer.writeheader() # write header
-
-            cluster_obs = {}
-            cluster_obs.update({fields[0]: date})
-
-            for n in range(self.num_clusters):
-                i = self.get_iteration_number(n)
-                cluster_obs.update({fields[i + 1]: obs[n][0]})
-                cluster_obs.update({fields[i + 2]: obs[n][1]})
-                cluster_obs.update({fields[i + 3]: obs[n][2]})
-                cluster_obs.update({fields[i + 4]: obs[n][3]})
-                cluster_obs.update({fields[i + 5]: obs[n][4]})
-                cluster_obs.update({fields[i + 6]: obs[n][5]})
-                cluster_obs.update({fields[i + 7]: obs[n][6]})
-                cluster_obs.update({fields[i + 8]: obs[n][7]})
-            writer.writerow(cluster_obs)
-        return
+    # Observation entries that only change on reset
+    def fill_static_state(self):
+        obs = self._obs_buf
+        n = self.num_clusters
 
-    def get_iteration_number(self, n):
-        num_fields_per_cluster = 8
-        return num_fields_per_cluster * n
+        obs[:n, 1] = self.cpu_capacity
+        obs[:n, 3] = self.memory_capacity
 
+        # Rows for the spreading actions and reject have no cluster metrics
+        obs[n:, :NUM_METRICS_CLUSTER + 1] = -1
+
+    # Save observation to csv file
+    def save_obs_to_csv(self, obs_file, obs, date):
+        if self._obs_writer is None:
+            self._obs_fh = open(obs_file, 'a+', newline='', buffering=1 << 20)  # append
+            self._obs_writer = csv.writer(self._obs_fh)
+            # Rows still in memory are written if the env is collected or at exit
+            self._obs_finalizer = weakref.finalize(self, write_and_close_csv,
+                                                   self._obs_fh, self._obs_writer, self._obs_rows)
+
+        # Positional row: date, then the first 8 metrics of every cluster
+        row = [date]
+        row.extend(obs[:self.num_clusters, :8].ravel())
+        self._obs_rows.append(row)
+        if len(self._obs_rows) >= OBS_CSV_BATCH_ROWS:
+            self.flush_obs_csv()
+
+    # Write the observation rows kept in memory
+    def flush_obs_csv(self):
+        if self._obs_rows:
+            self._obs_writer.writerows(self._obs_rows)
+            self._obs_rows.clear()
+
+    def close_obs_csv(self):
+        if self._obs_fh is not None:
+            self._obs_finalizer()
+            self._obs_fh = None
+            self._obs_writer = None
+
+    # Running requests are kept as Struct-of-Arrays: one row per cluster hosting replicas of a deployment
     def enqueue_request(self, request: DeploymentRequest) -> None:
-        heapq.heappush(self.running_requests, (request.departure_time, request))
+        if request.is_deployment_split:
+            clusters = np.flatnonzero(request.split_clusters)
+            replicas = request.split_clusters[clusters]
+            factor = SPLIT_RELEASE_FACTOR
+        else:
+            clusters = request.deployed_cluster
+            replicas = request.num_replicas
+            factor = FULL_LATENCY_FACTOR
+
+        # Reuse released slots first, then append after the slots in use
+        count = np.size(clusters)
+        slots = np.flatnonzero(self._q_exp[:self._q_size] == np.inf)[:count]
+        if slots.size < count:
+            start = self._q_size
+            end = start + count - slots.size
+            if end > self._q_exp.shape[0]:
+                self.grow_queue(end)
+            slots = np.concatenate((slots, np.arange(start, end)))
+            self._q_size = end
+
+        self._q_cluster[slots] = clusters
+        self._q_cpu[slots] = request.cpu_request
+        self._q_mem[slots] = request.memory_request
+        self._q_rep[slots] = replicas
+        self._q_exp[slots] = request.departure_time
+        self._q_next_exp = min(self._q_next_exp, request.departure_time)
+        self._q_factor[slots] = factor
+
+    # Double the capacity of the running requests queue
+    def grow_queue(self, min_capacity):
+        capacity = max(2 * self._q_exp.shape[0], min_capacity)
+        for field in QUEUE_FIELDS:
+            queue = getattr(self, field)
+            grown = np.zeros(capacity, dtype=queue.dtype)
+            grown[:self._q_size] = queue[:self._q_size]
+            setattr(self, field, grown)
 
     # Action masks
+    # The returned array is overwritten by the next call, copy it to keep it across steps
     def action_masks(self):
-        valid_actions = np.ones(self.num_clusters + NUM_SPREADING_ACTIONS + 1, dtype=bool)
-        logging.info('[Action Mask]: (Before) Valid actions {} |'.format(valid_actions))
+        valid_actions = self._action_mask_buf
 
-        for i in range(self.num_clusters):
-            if self.check_if_cluster_is_full_after_full_deployment(i):
-                valid_actions[i] = False
-            else:
-                valid_actions[i] = True
-
-        # 4 additional actions: 3 strategies + Reject
-        valid_actions[self.num_clusters + FFD] = True
-        valid_actions[self.num_clusters + FFI] = True
-        valid_actions[self.num_clusters + BF1B1] = True
-        # valid_actions[self.num_clusters + NF1B1] = True
-        valid_actions[self.num_clusters + NUM_SPREADING_ACTIONS] = True
-        logging.info('[Action Mask]: Valid actions {} |'.format(valid_actions))
+        # Full deployments are valid only on clusters that would not be full (masks refreshed with the request)
+        np.logical_or(self._full_mask_cpu, self._full_mask_mem, out=valid_actions[:self.num_clusters])
+        np.logical_not(valid_actions[:self.num_clusters], out=valid_actions[:self.num_clusters])
+
+        # 4 additional actions: 3 strategies + Reject, always valid
+        if __debug__ and _log.isEnabledFor(logging.DEBUG):
+            _log.debug('[Action Mask]: Valid actions {} |'.format(valid_actions))
         return valid_actions
 
+    # Mark the clusters that would be full after a full deployment of the current request
+    # Refreshed whenever the request or the allocated resources change
+    def update_full_mask(self):
+        self._full_mask_cpu = self.allocated_cpu + self._total_cpu > self.cpu_threshold
+        self._full_mask_mem = self.allocated_memory + self._total_memory > self.memory_threshold
+
     # Double-check if the selected cluster is full
     def check_if_cluster_is_full_after_full_deployment(self, action):
-        total_cpu = self.deployment_request.num_replicas * self.deployment_request.cpu_request
-        total_memory = self.deployment_request.num_replicas * self.deployment_request.memory_request
-
-        if (self.allocated_cpu[action] + total_cpu > 0.95 * self.cpu_capacity[action]
-                or self.allocated_memory[action] + total_memory > 0.95 * self.memory_capacity[action]):
-            logging.info('[Check]: Cluster {} is full...'.format(action + 1))
+        if self._full_mask_cpu[action] or self._full_mask_mem[action]:
+            if __debug__ and _log.isEnabledFor(logging.INFO):
+                _log.info('[Check]: Cluster {} is full...'.format(action + 1))
             return True
 
         return False
 
     # Double-check if the selected clusters are full (spread strategy)
     def check_if_clusters_are_full_after_split_deployment(self, div):
-        for d in range(len(div)):
-            total_cpu = self.deployment_request.cpu_request * div[d]
-            total_memory = self.deployment_request.memory_request * div[d]
-
-            if (self.allocated_cpu[d] + total_cpu > 0.95 * self.cpu_capacity[d]
-                    or self.allocated_memory[d] + total_memory > 0.95 * self.memory_capacity[d]):
-                logging.info('[Check]: Cluster {} is full...'.format(d))
-                return True
+        request = self.deployment_request
+        if heuristics_nb.clusters_full_after_split(div, float(request.cpu_request), float(request.memory_request),
+                                                   self.allocated_cpu, self.allocated_memory,
+                                                   self.cpu_threshold, self.memory_threshold):
+            if __debug__ and _log.isEnabledFor(logging.INFO):
+                _log.info('[Check]: Clusters {} are full...'.format(div))
+            return True
 
         return False
 
+    # Draw a new latency matrix (0 for the same node) into the preallocated float64 arrays
+    def draw_latency_matrix(self):
+        self.latency_matrix[:] = self.np_random.integers(low=MIN_DELAY, high=MAX_DELAY,
+                                                         size=(self.num_clusters, self.num_clusters))
+        np.fill_diagonal(self.latency_matrix, 0)
+        self.latency_matrix.mean(axis=1, out=self.latency)
+
     # Increase latency in the episode
     def increase_latency(self, n, factor):
         avg_value = self.latency[n]
-        for n2 in range(self.num_clusters):
-            if n == n2:  # for the same node assume 0
-                self.latency_matrix[n][n2] = 0
-            else:
-                prev = self.latency_matrix[n][n2]
-                new_latency = max(min(prev * factor, MAX_DELAY), MIN_DELAY)
+        self.scale_latency_row(n, factor)
 
-                self.latency_matrix[n][n2] = new_latency
-
-                if self.latency_matrix[n][n2] == 0:
-                    self.latency_matrix[n][n2] = 1.0
+        # Update Latency of all nodes
+        self.latency_matrix.mean(axis=1, out=self.latency)
 
-                # logging.info("[Increase Latency] previous latency: {} "
-                #             "| updated Latency: {}".format(prev, self.latency_matrix[n][n2]))
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Increase Latency] cluster: {} | previous latency: {} "
+                      "| updated Latency: {}".format(n + 1, avg_value, self.latency[n]))
 
-                self.latency_matrix[n2][n] = self.latency_matrix[n][n2]
+    # Increase latency of several clusters at once by the same factor
+    def increase_latency_batch(self, clusters, factor):
+        # Same row/column updates as consecutive increase_latency calls, with a single mean at the end
+        for n in clusters:
+            self.scale_latency_row(n, factor)
 
         # Update Latency of all nodes
-        for c in range(self.num_clusters):
-            self.latency[c] = mean(self.latency_matrix[c])
+        self.latency_matrix.mean(axis=1, out=self.latency)
+
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Increase Latency] clusters: {} | factor: {} | updated Latency: {}".format(
+                clusters, factor, self.latency))
 
-        logging.info("[Increase Latency] cluster: {} | previous latency: {} "
-                     "| updated Latency: {}".format(n + 1, avg_value, self.latency[n]))
+    # Scale the latencies of cluster n (multiply or divide by factor), copying its row into its column
+    # The row is updated in place: no temporaries for the scaled and clipped values
+    def scale_latency_row(self, n, factor, op=np.multiply):
+        row = self.latency_matrix[n]
+        op(row, factor, out=row)
+        np.clip(row, MIN_DELAY, MAX_DELAY, out=row)
+        row[n] = 0  # for the same node assume 0
+        self.latency_matrix[:, n] = row
 
     # Decrease Latency in the episode
     def decrease_latency(self, n, factor):
         avg_value = self.latency[n]
-        for n2 in range(self.num_clusters):
-            if n == n2:  # for the same node assume 0
-                self.latency_matrix[n][n2] = 0
-            else:
-                prev = self.latency_matrix[n][n2]
-                new_latency = max(min(prev / factor, MAX_DELAY), MIN_DELAY)
-
-                self.latency_matrix[n][n2] = new_latency
-
-                if self.latency_matrix[n][n2] == 0:
-                    self.latency_matrix[n][n2] = 1.0
-
-                self.latency_matrix[n2][n] = self.latency_matrix[n][n2]
-
-                # logging.info("[Decrease Latency] previous latency: {} "
-                #             "| updated Latency: {}".format(prev, self.latency_matrix[n][n2]))
+        self.scale_latency_row(n, factor, np.divide)
 
         # Update Latency of all nodes
-        for c in range(self.num_clusters):
-            self.latency[c] = mean(self.latency_matrix[c])
-
-        logging.info("[Decrease Latency] cluster: {} | previous latency: {} "
-                     "| updated Latency: {}".format(n + 1, avg_value, self.latency[n]))
-
-    # Remove deployment request
-    def dequeue_request(self):
-        _, deployment_request = heapq.heappop(self.running_requests)
-        # logging.info("[Dequeue] Request {}...".format(deployment_request))
-        logging.info("[Dequeue] Request will be terminated...")
-        # logging.info("[Dequeue] Before: ")
-        # logging.info("[Dequeue] CPU allocated: {}".format(self.allocated_cpu))
-        # logging.info("[Dequeue] CPU free: {}".format(self.free_cpu))
-        # logging.info("[Dequeue] MEM allocated: {}".format(self.allocated_memory))
-        # logging.info("[Dequeue] MEM free: {}".format(self.free_memory))
-
-        if deployment_request.is_deployment_split:
-            # logging.info("[Dequeue] Deployment is split...")
-            for d in range(self.num_clusters):
-                total_cpu = self.deployment_request.cpu_request * self.deployment_request.split_clusters[d]
-                total_memory = self.deployment_request.memory_request * self.deployment_request.split_clusters[d]
-
-                # Update allocate amounts
-                self.allocated_cpu[d] -= total_cpu
-                self.allocated_memory[d] -= total_memory
-
-                # Update free resources
-                self.free_cpu[d] = self.cpu_capacity[d] - self.allocated_cpu[d]
-                self.free_memory[d] = self.memory_capacity[d] - self.allocated_memory[d]
-
-                # Decrease Latency if replicas were there
-                if total_cpu != 0:
-                    self.decrease_latency(d, 1.10)  # only 10% if split
-        else:
-            # logging.info("[Dequeue] Deployment is not split...")
-            n = deployment_request.deployed_cluster
-            total_cpu = self.deployment_request.num_replicas * self.deployment_request.cpu_request
-            total_memory = self.deployment_request.num_replicas * self.deployment_request.memory_request
-
-            # Update allocate amounts
-            self.allocated_cpu[n] -= total_cpu
-            self.allocated_memory[n] -= total_memory
-
-            # Update free resources
-            self.free_cpu[n] = self.cpu_capacity[n] - self.allocated_cpu[n]
-            self.free_memory[n] = self.memory_capacity[n] - self.allocated_memory[n]
-
-            # Decrease Latency
-            self.decrease_latency(n, 1.15)  # 15% max reduction
-
-        # logging.info("[Dequeue] After: ")
-        # logging.info("[Dequeue] CPU allocated: {}".format(self.allocated_cpu))
-        # logging.info("[Dequeue] CPU free: {}".format(self.free_cpu))
-        # logging.info("[Dequeue] MEM allocated: {}".format(self.allocated_memory))
-        # logging.info("[Dequeue] MEM free: {}".format(self.free_memory))
-
-    # Check if all clusters are full
+        self.latency_matrix.mean(axis=1, out=self.latency)
+
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Decrease Latency] cluster: {} | previous latency: {} "
+                      "| updated Latency: {}".format(n + 1, avg_value, self.latency[n]))
+
+    # Remove the expired deployment requests
+    def dequeue_request(self, expired):
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Dequeue] {} request(s) will be terminated...".format(expired.size))
+
+        clusters = self._q_cluster[expired]
+        replicas = self._q_rep[expired]
+
+        # Update allocated and free amounts with the released resources
+        released_cpu = np.bincount(clusters, weights=self._q_cpu[expired] * replicas, minlength=self.num_clusters)
+        released_memory = np.bincount(clusters, weights=self._q_mem[expired] * replicas, minlength=self.num_clusters)
+        self.allocated_cpu -= released_cpu
+        self.free_cpu += released_cpu
+        self.allocated_memory -= released_memory
+        self.free_memory += released_memory
+
+        # Decrease Latency where replicas were, in departure order, with a single mean at the end
+        factors = self._q_factor[expired]
+        for i in np.argsort(self._q_exp[expired], kind='stable'):
+            self.scale_latency_row(clusters[i], factors[i], np.divide)
+        self.latency_matrix.mean(axis=1, out=self.latency)
+
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[Decrease Latency] clusters: {} | updated Latency: {}".format(clusters, self.latency))
+
+        # Release the slots and shrink the part in use down to the last running request
+        self._q_exp[expired] = np.inf
+        running = np.flatnonzero(self._q_exp[:self._q_size] != np.inf)
+        self._q_size = running[-1] + 1 if running.size else 0
+        self._q_next_exp = self._q_exp[:self._q_size].min() if self._q_size else np.inf
+
+    # Check if all clusters are full, i.e. a full deployment of the current request fits nowhere
     def check_if_cluster_is_really_full(self) -> bool:
-        is_full = [self.check_if_cluster_is_full_after_full_deployment(i) for i in range(self.num_clusters)]
-        return np.all(is_full)
+        return bool(np.logical_or(self._full_mask_cpu, self._full_mask_mem).all())
 
-    # Create a deployment request
-    def deployment_generator(self):
-        deployment_list = get_c2e_deployment_list()
-        n = self.np_random.integers(low=0, high=len(deployment_list))
-        d = deployment_list[n - 1]
+    # Draw the arrivals, durations, deployments and replicas of the next episode_length requests at once
+    def draw_request_stream(self):
+        size = self.episode_length
+        self._arrival_draws = self.np_random.exponential(scale=1 / self.arrival_rate_r, size=size)
+        self._duration_draws = self.np_random.exponential(scale=self.call_duration_r, size=size)
+        self._deployment_draws = self.np_random.integers(low=0, high=len(self._deployment_template), size=size)
 
         if self.min_replicas == self.max_replicas:
-            d.num_replicas = self.min_replicas
+            self._replica_draws = np.full(size, self.min_replicas, dtype=np.int64)
         else:
-            d.num_replicas = self.np_random.integers(low=self.min_replicas, high=self.max_replicas)
+            self._replica_draws = self.np_random.integers(low=self.min_replicas, high=self.max_replicas, size=size)
+        self._stream_pos = 0
+
+    # Gini coefficient of the load served, recomputed only after new placements
+    def get_gini(self):
+        if self._gini_placements != self.num_placements:
+            self._gini = calculate_gini_coefficient(self.avg_load_served)
+            self._gini_placements = self.num_placements
+        return self._gini
+
+    # Create a deployment request
+    def deployment_generator(self, i):
+        # Copy the template, the request is updated with its placement later on
+        d = copy.copy(self._deployment_template[self._deployment_draws[i] - 1])
+        d.num_replicas = int(self._replica_draws[i])
         return d
 
     # Select (random) the next deployment request
     def next_request(self) -> None:
-        arrival_time = self.current_time + self.np_random.exponential(scale=1 / self.arrival_rate_r)
-        departure_time = arrival_time + self.np_random.exponential(scale=self.call_duration_r)
+        if self._stream_pos == self.episode_length:
+            self.draw_request_stream()
+        i = self._stream_pos
+        self._stream_pos += 1
+
+        arrival_time = self.current_time + self._arrival_draws[i]
+        departure_time = arrival_time + self._duration_draws[i]
         self.dt = departure_time - arrival_time
         self.current_time = arrival_time
 
-        while True:
-            if self.running_requests:
-                next_departure_time, _ = self.running_requests[0]
-                if next_departure_time < arrival_time:
-                    self.dequeue_request()
-                    continue
-            break
-
-        self.deployment_request = self.deployment_generator()
-        logging.info('[Next Request]: Name: {} | Replicas: {}'.format(self.deployment_request.name,
-                                                                      self.deployment_request.num_replicas))
+        # Scan the queue only when the earliest departure has passed
+        if self._q_next_exp < arrival_time:
+            self.dequeue_request(np.flatnonzero(self._q_exp[:self._q_size] < arrival_time))
+
+        self.deployment_request = request = self.deployment_generator(i)
+
+        # Total resources of the request, fixed until the next request
+        self._total_cpu = request.num_replicas * request.cpu_request
+        self._total_memory = request.num_replicas * request.memory_request
+        self.update_full_mask()
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info('[Next Request]: Name: {} | Replicas: {}'.format(request.name, request.num_replicas))
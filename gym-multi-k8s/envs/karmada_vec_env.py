@@ -0,0 +1,41 @@
+import logging
+
+import numpy as np
+from stable_baselines3.common.vec_env import DummyVecEnv
+
+from envs.karmada_scheduling_env import NUM_SPREADING_ACTIONS
+
+_log = logging.getLogger(__name__)
+
+
+class KarmadaSchedulingVecEnv(DummyVecEnv):
+    """
+    Steps K KarmadaSchedulingEnv copies in the current process, like DummyVecEnv,
+    and returns the action masks of all envs as one preallocated (K, num_actions) array,
+    without going through env_method and a new array on every call.
+    Used by test_deepset.py, which reads the masks directly; training agents still get
+    their masks through env_method("action_masks").
+
+    :param env_fns: a list of functions that return KarmadaSchedulingEnv instances
+    """
+
+    def __init__(self, env_fns):
+        super().__init__(env_fns)
+        self.karmada_envs = [env.unwrapped for env in self.envs]
+        num_clusters = {env.num_clusters for env in self.karmada_envs}
+        if len(num_clusters) != 1:
+            raise ValueError("All envs must have the same number of clusters, got {}".format(num_clusters))
+        self.num_clusters = num_clusters.pop()
+
+        # Action masks of all envs, overwritten on every mask call: spreading actions and reject are always valid
+        self.valid_actions = np.ones((self.num_envs, self.num_clusters + NUM_SPREADING_ACTIONS + 1), dtype=bool)
+
+        if __debug__ and _log.isEnabledFor(logging.INFO):
+            _log.info("[VecEnv] Num Envs: {} | Num_Clusters: {}".format(self.num_envs, self.num_clusters))
+
+    # Action masks of all envs: a full deployment is valid only if the cluster keeps enough room
+    # The returned array is reused by the next call, copy it to keep it across steps
+    def action_masks(self):
+        for k, env in enumerate(self.karmada_envs):
+            self.valid_actions[k] = env.action_masks()
+        return self.valid_actions
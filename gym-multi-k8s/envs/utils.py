@@ -1,4 +1,5 @@
 import csv
+import functools
 from dataclasses import dataclass
 
 import gym
@@ -23,7 +24,7 @@ class DeploymentRequest:
     departure_time: float
     deployed_cluster: int = None  # All replicas deployed in one cluster
     is_deployment_split: bool = False  # has the deployment request been split?
-    split_clusters: [] = None  # what is the distribution of the deployment request?
+    split_clusters: npt.NDArray = None  # what is the distribution of the deployment request? (replicas per cluster)
     expected_latency: int = None  # expected latency after deployment
     expected_cost: int = None  # expected cost after deployment
 
@@ -42,6 +43,11 @@ class Request:
     serving_node: int = None
     service_type: int = None  # currently: 0==SVE 1==SDP 2==APP 3==LAF
 
+    # Requests departing at the same time are left as they are in the running requests heap
+    # Without it, heapq falls back to comparing the dataclasses on ties and raises a TypeError
+    def __lt__(self, other):
+        return False
+
 
 # Reverses a dict
 def sort_dict_by_value(d, reverse=False):
@@ -54,6 +60,8 @@ def set_box_color(bp, color):
     plt.setp(bp['caps'], color=color)
     plt.setp(bp['medians'], color=color)
 
+# Built once per process and shared by all envs: copy a request before modifying it
+@functools.lru_cache(maxsize=1)
 def get_c2e_deployment_list():
     deployment_list = [
         # 1 adapter-amqp
@@ -165,7 +173,7 @@ def get_c2e_deployment_list():
                           arrival_time=0, departure_time=0,
                           latency_threshold=600),
     ]
-    return deployment_list
+    return tuple(deployment_list)
 
 
 def latency_greedy_policy(actions: int, action_mask: npt.NDArray, lat_val: npt.NDArray, lat_threshold: float) -> int:
@@ -187,15 +195,11 @@ def cost_greedy_policy(actions: int, env: gym.Env, action_mask: npt.NDArray) ->
     feasible_clusters = np.argwhere(action_mask[:-actions] == True).flatten()
     # print("Feasible clusters: {}".format(feasible_clusters))
 
-    mean_cost = []
-    for c in feasible_clusters:
-        type_id = env.cluster_type[c]
-        mean_cost.append(env.default_cluster_types[type_id]['cost'])
-
     if len(feasible_clusters) == 0:
         return len(action_mask) - 1
-    # print("Return: {}".format(feasible_clusters[np.argmin(mean_load)]))
-    return feasible_clusters[np.argmin(mean_cost)]
+
+    # Cost per cluster is precomputed by the env from the cluster types
+    return feasible_clusters[np.argmin(env.cluster_cost[feasible_clusters])]
 
 
 def cpu_greedy_policy(actions: int, env: gym.Env, action_mask: npt.NDArray) -> int:
@@ -281,33 +285,15 @@ def save_obs_to_csv(file_name, timestamp, num_pods, desired_replicas, cpu_usage,
 '''
 
 
-def save_to_csv(file_name, episode, reward, ep_block_prob, ep_accepted_requests, ep_rejected_requests, ep_deploy_all, ffd, ffi, bf1b1, avg_latency,
-                avg_cost, avg_cpu_cluster_selected, gini, execution_time): # bf1b1, nf1b1
-    file = open(file_name, 'a+', newline='')  # append
-    # file = open(file_name, 'w', newline='')
-    with file:
-        fields = ['episode', 'reward', 'ep_block_prob', 'ep_accepted_requests', 'ep_rejected_requests', 'ep_deploy_all',
-                  'ep_ffd', 'ep_ffi', 'ep_bf1b1', 'avg_latency', 'avg_cost',
-                  'avg_cpu_cluster_selected', 'gini', 'execution_time'] # 'ep_bf1b1', 'ep_ffi', 'ep_nf1b1'
-        writer = csv.DictWriter(file, fieldnames=fields)
-        # writer.writeheader()
-        writer.writerow(
-            {'episode': episode,
-             'reward': float("{:.2f}".format(reward)),
-             'ep_block_prob': float("{:.2f}".format(ep_block_prob)),
-             'ep_accepted_requests': float("{:.2f}".format(ep_accepted_requests)),
-             'ep_rejected_requests': float("{:.2f}".format(ep_rejected_requests)),
-             'ep_deploy_all': float("{:.2f}".format(ep_deploy_all)),
-             'ep_ffd': float("{:.2f}".format(ffd)),
-             'ep_ffi': float("{:.2f}".format(ffi)),
-             'ep_bf1b1': float("{:.2f}".format(bf1b1)),
-             # 'ep_nf1b1': float("{:.2f}".format(nf1b1)),
-             'avg_latency': float("{:.2f}".format(avg_latency)),
-             'avg_cost': float("{:.2f}".format(avg_cost)),
-             'avg_cpu_cluster_selected': float("{:.2f}".format(avg_cpu_cluster_selected)),
-             'gini': float("{:.2f}".format(gini)),
-             'execution_time': float("{:.2f}".format(execution_time))}
-        )
+# Append the episode results through an open csv.writer, the caller owns (and flushes) the file
+def save_to_csv(writer, episode, reward, ep_block_prob, ep_accepted_requests, ep_rejected_requests, ep_deploy_all, ffd,
+                ffi, bf1b1, avg_latency, avg_cost, avg_cpu_cluster_selected, gini, execution_time):  # bf1b1, nf1b1
+    # fields: 'episode', 'reward', 'ep_block_prob', 'ep_accepted_requests', 'ep_rejected_requests', 'ep_deploy_all',
+    #         'ep_ffd', 'ep_ffi', 'ep_bf1b1', 'avg_latency', 'avg_cost', 'avg_cpu_cluster_selected', 'gini',
+    #         'execution_time'
+    writer.writerow([episode] + [float("{:.2f}".format(value)) for value in (
+        reward, ep_block_prob, ep_accepted_requests, ep_rejected_requests, ep_deploy_all, ffd, ffi, bf1b1,
+        avg_latency, avg_cost, avg_cpu_cluster_selected, gini, execution_time)])
 
 
 def normalize(value, min_value, max_value):
@@ -318,15 +304,14 @@ def normalize(value, min_value, max_value):
 
 # Calculation of Gini Coefficient
 # 0 is better - 1 is worse!
+# Closed form over the sorted loads, equal to sum(|x_i - x_j|) / (2 * n^2 * mean)
 def calculate_gini_coefficient(loads):
     n = len(loads)
-    total_load = sum(loads)
-    mean_load = total_load / n if n != 0 else 0
+    if n == 0:
+        return 0
 
-    if mean_load == 0:
+    cum_load = np.cumsum(np.sort(loads))
+    if cum_load[-1] == 0:
         return 0  # Handle the case where all loads are zero to avoid division by zero
 
-    gini_numerator = sum(abs(loads[i] - loads[j]) for i in range(n) for j in range(n))
-    gini_coefficient = gini_numerator / (2 * n ** 2 * mean_load)
-
-    return gini_coefficient
+    return (n + 1 - 2 * cum_load.sum() / cum_load[-1]) / n
@@ -5,8 +5,8 @@ from matplotlib import pyplot as plt
 from stable_baselines3 import PPO, A2C
 from stable_baselines3.common.callbacks import CheckpointCallback
 from sb3_contrib import RecurrentPPO, MaskablePPO
-from stable_baselines3.common.vec_env import SubprocVecEnv, VecMonitor
-from envs.karmada_scheduling_env import KarmadaSchedulingEnv
+from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecMonitor
+from envs.karmada_scheduling_env import KarmadaSchedulingEnv, INFO_KEYWORDS, SEED, DEFAULT_FILE_NAME_RESULTS
 from envs.fog_env import FogOrchestrationEnv
 from envs.ppo_deepset import PPO_DeepSets
 from envs.dqn_deepset import DQN_DeepSets
@@ -37,12 +37,16 @@ parser.add_argument('--test_path', default='results/karmada/risk/'
                     help='Testing path, ex: logs/model/test.zip')
 parser.add_argument('--steps', default=200000, help='Save model after X steps')
 parser.add_argument('--total_steps', default=200000, help='The total number of steps.')
+parser.add_argument('--n_envs', default=1, help='Number of parallel karmada envs')
+parser.add_argument('--log_level', default='WARNING',
+                    help='Logging level of run.log: ["DEBUG", "INFO", "WARNING"] (INFO logs every env step)')
 
 # TODO: add other arguments if needed
 # parser.add_argument('--k8s', default=False, action="store_true", help='K8s mode')
 # parser.add_argument('--goal', default='cost', help='Reward Goal: ["cost", "latency"]')
 
 args = parser.parse_args()
+logging.getLogger().setLevel(args.log_level.upper())
 
 
 def get_model(alg, env, tensorboard_log):
@@ -85,7 +89,7 @@ def get_load_model(env, alg, tensorboard_log, load_path):
         logging.info('Invalid algorithm!')
 
 
-def get_env(env_name, num_clusters, reward_function, min_replicas, max_replicas):
+def get_env(env_name, num_clusters, reward_function, min_replicas, max_replicas, n_envs=1):
     envs = 0
 
     latency_weight = 1.0
@@ -93,26 +97,25 @@ def get_env(env_name, num_clusters, reward_function, min_replicas, max_replicas)
     gini_weight = 0.0
 
     if env_name == "karmada":
-        env = KarmadaSchedulingEnv(num_clusters=num_clusters, arrival_rate_r=100, call_duration_r=1,
-                                   episode_length=100,
-                                   latency_weight=latency_weight, cost_weight=cost_weight, gini_weight=gini_weight,
-                                   min_replicas=min_replicas, max_replicas=max_replicas,
-                                   reward_function=reward_function)
-        # For faster training!
-        # otherwise just comment the following lines
-
-        env.reset()
-        _, _, _, info = env.step(0)
-        info_keywords = tuple(info.keys())
-        env = SubprocVecEnv([lambda: KarmadaSchedulingEnv(num_clusters=num_clusters, arrival_rate_r=100,
-                                                          call_duration_r=1, episode_length=100,
-                                                          latency_weight=latency_weight, cost_weight=cost_weight,
-                                                          gini_weight=gini_weight,
-                                                          min_replicas=min_replicas, max_replicas=max_replicas,
-                                                          reward_function=reward_function)
-                             for i in range(1)])
+        # Each env draws its own request stream, parallel envs also write their own results file
+        file_names = ([DEFAULT_FILE_NAME_RESULTS] if n_envs == 1
+                      else ['{}_{}'.format(DEFAULT_FILE_NAME_RESULTS, i) for i in range(n_envs)])
+        env_fns = [lambda i=i: KarmadaSchedulingEnv(num_clusters=num_clusters, arrival_rate_r=100,
+                                                    call_duration_r=1, episode_length=100,
+                                                    latency_weight=latency_weight, cost_weight=cost_weight,
+                                                    gini_weight=gini_weight,
+                                                    min_replicas=min_replicas, max_replicas=max_replicas,
+                                                    reward_function=reward_function,
+                                                    seed=SEED + i,
+                                                    file_results_name=file_names[i])
+                   for i in range(n_envs)]
+        if n_envs == 1:
+            # A single worker process only adds pickling on every step
+            env = DummyVecEnv(env_fns)
+        else:
+            env = SubprocVecEnv(env_fns)
 
-        envs = VecMonitor(env, filename="vec_karmada_gym_results_", info_keywords=info_keywords)
+        envs = VecMonitor(env, filename="vec_karmada_gym_results_", info_keywords=INFO_KEYWORDS)
 
     elif env_name == 'fog':
         env = FogOrchestrationEnv(10, 100, 1)
@@ -125,7 +128,8 @@ def get_env(env_name, num_clusters, reward_function, min_replicas, max_replicas)
                                             episode_length=100,
                                             seed=2)
                 for i in range(8)
-            ]
+            ],
+            start_method='forkserver'
         )
         envs = VecMonitor(env, info_keywords=info_keywords)
 
@@ -186,8 +190,9 @@ def main():
 
     steps = int(args.steps)
     total_steps = int(args.total_steps)
+    n_envs = int(args.n_envs)
 
-    env = get_env(env_name, num_clusters, reward, min_replicas, max_replicas)
+    env = get_env(env_name, num_clusters, reward, min_replicas, max_replicas, n_envs)
     print("env: {}".format(env))
 
     tensorboard_log = "results/" + env_name + "/" + reward + "/"
@@ -1,9 +1,10 @@
 import logging
 
 import numpy as np
-from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv, VecMonitor, VecNormalize
+from stable_baselines3.common.vec_env import VecMonitor
 from tqdm import tqdm
-from envs.karmada_scheduling_env import KarmadaSchedulingEnv
+from envs.karmada_scheduling_env import KarmadaSchedulingEnv, INFO_KEYWORDS
+from envs.karmada_vec_env import KarmadaSchedulingVecEnv
 from envs.dqn_deepset import DQN_DeepSets
 from envs.ppo_deepset import PPO_DeepSets
 
@@ -36,16 +37,8 @@ if __name__ == "__main__":
         for r in replicas:
             # min = c
             # max = 4 * c
-            env = KarmadaSchedulingEnv(num_clusters=c, arrival_rate_r=episode_length, call_duration_r=call_duration_r,
-                                       episode_length=episode_length,
-                                       latency_weight=latency_weight, cost_weight=cost_weight, gini_weight=gini_weight,
-                                       min_replicas=r, max_replicas=r,
-                                       reward_function=reward_function)
-            env.reset()
-            _, _, _, info = env.step(0)
-            info_keywords = tuple(info.keys())
-
-            envs = DummyVecEnv([lambda: KarmadaSchedulingEnv(
+            # The vec env computes the action masks in place, without an env_method call per step
+            vec_env = KarmadaSchedulingVecEnv([lambda: KarmadaSchedulingEnv(
                 num_clusters=c, arrival_rate_r=episode_length, call_duration_r=call_duration_r,
                 episode_length=episode_length,
                 latency_weight=latency_weight, cost_weight=cost_weight, gini_weight=gini_weight,
@@ -53,7 +46,7 @@ if __name__ == "__main__":
                 min_replicas=r, max_replicas=r,
                 file_results_name=str(i) + '_karmada_gym_results_num_clusters_' + str(c) + '_replicas_' + str(r))
                                 ])
-            envs = VecMonitor(envs, MONITOR_PATH, info_keywords=info_keywords)
+            envs = VecMonitor(vec_env, MONITOR_PATH, info_keywords=INFO_KEYWORDS)
 
             # PPO or DQN
             agent = None
@@ -74,12 +67,12 @@ if __name__ == "__main__":
             # Test the agent for 100 episodes
             for _ in tqdm(range(episodes)):
                 obs = envs.reset()
-                action_mask = np.array(envs.env_method("action_masks"))
+                action_mask = vec_env.action_masks()
                 done = False
                 while not done:
                     action = agent.predict(obs, action_mask)
                     obs, reward, dones, info = envs.step(action)
-                    action_mask = np.array(envs.env_method("action_masks"))
+                    action_mask = vec_env.action_masks()
                     done = dones[0]
 
             i += 1
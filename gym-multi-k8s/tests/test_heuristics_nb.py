@@ -0,0 +1,139 @@
+import math
+
+import numpy as np
+import pytest
+
+from envs import heuristics_nb
+
+NUM_CASES = 2000
+
+
+# Reference implementations: the original per-cluster Python loops of the env
+def first_fit_decreasing_ref(num_replicas, cpu_req, mem_req, free_cpu, free_mem):
+    num_clusters = len(free_cpu)
+    distribution = [0] * num_clusters
+    max_replicas = num_replicas
+
+    min_factor = int(math.ceil(min(min(free_cpu[n] / cpu_req, free_mem[n] / mem_req) for n in range(num_clusters))))
+    if min_factor >= max_replicas:
+        min_factor = max_replicas - 1
+
+    # Decreasing free CPU, ties in cluster order
+    for n in sorted(range(num_clusters), key=lambda x: free_cpu[x], reverse=True):
+        if num_replicas == 0:
+            break
+        if num_replicas > 0 and min_factor < num_replicas and (
+                (cpu_req * min_factor < free_cpu[n]) and (mem_req * min_factor < free_mem[n])):
+            distribution[n] += min_factor
+            num_replicas -= min_factor
+        elif num_replicas > 0 and ((cpu_req < free_cpu[n]) and (mem_req < free_mem[n])):
+            distribution[n] += 1
+            num_replicas -= 1
+
+    for n in range(num_clusters):
+        if num_replicas == 0:
+            break
+        if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
+            distribution[n] += 1
+            num_replicas -= 1
+    return distribution
+
+
+def first_fit_increasing_ref(num_replicas, cpu_req, mem_req, free_cpu, free_mem):
+    num_clusters = len(free_cpu)
+    distribution = [0] * num_clusters
+
+    min_factor = int(math.ceil(min(min(free_cpu[n] / cpu_req, free_mem[n] / mem_req) for n in range(num_clusters))))
+    if min_factor >= num_replicas:
+        min_factor = num_replicas - 1
+
+    for n in sorted(range(num_clusters), key=lambda x: free_cpu[x]):
+        if num_replicas == 0:
+            break
+        if num_replicas > 0 and min_factor < num_replicas and (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
+            distribution[n] += min_factor
+            num_replicas -= min_factor
+
+    for n in range(num_clusters):
+        if num_replicas == 0:
+            break
+        if (cpu_req < free_cpu[n]) and (mem_req < free_mem[n]):
+            distribution[n] += 1
+            num_replicas -= 1
+    return distribution
+
+
+def best_fit_1b1_ref(num_replicas, cpu_req, mem_req, free_cpu, free_mem):
+    num_clusters = len(free_cpu)
+    distribution = [0] * num_clusters
+    free_cpu = list(free_cpu)
+    free_mem = list(free_mem)
+
+    for _ in range(num_replicas):
+        best_fit_bin = None
+        best_fit_space = float('inf')
+        for cluster_idx in sorted(range(num_clusters), key=lambda x: free_cpu[x]):
+            if free_cpu[cluster_idx] >= cpu_req and free_mem[cluster_idx] >= mem_req:
+                space = free_cpu[cluster_idx] - cpu_req + free_mem[cluster_idx] - mem_req
+                if space < best_fit_space:
+                    best_fit_bin = cluster_idx
+                    best_fit_space = space
+
+        if best_fit_bin is not None:
+            distribution[best_fit_bin] += 1
+            free_cpu[best_fit_bin] -= cpu_req
+            free_mem[best_fit_bin] -= mem_req
+    return distribution
+
+
+# Free resources on a coarse grid (ties in the sorts), sometimes exhausted (general path of the two-replica case)
+def random_cases(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(NUM_CASES):
+        num_clusters = int(rng.integers(2, 17))
+        num_replicas = int(rng.integers(2, 33))
+        cpu_req = float(rng.choice([0.1, 0.2, 0.25, 0.5, 1.0]))
+        mem_req = float(rng.choice([0.1, 0.2, 0.5, 1.0]))
+        free_cpu = rng.integers(-2, 40, size=num_clusters) * 0.25
+        free_mem = rng.integers(-2, 40, size=num_clusters) * 0.25
+        yield num_replicas, cpu_req, mem_req, free_cpu, free_mem
+
+
+@pytest.mark.parametrize("kernel, reference", [
+    (heuristics_nb.first_fit_decreasing, first_fit_decreasing_ref),
+    (heuristics_nb.first_fit_increasing, first_fit_increasing_ref),
+    (heuristics_nb.best_fit_1b1, best_fit_1b1_ref),
+])
+def test_split_kernels_match_reference(kernel, reference):
+    for num_replicas, cpu_req, mem_req, free_cpu, free_mem in random_cases(0):
+        expected = reference(num_replicas, cpu_req, mem_req, free_cpu.tolist(), free_mem.tolist())
+        np.testing.assert_array_equal(kernel(num_replicas, cpu_req, mem_req, free_cpu, free_mem), expected)
+
+
+# The caller's free resources are only updated once the split is accepted
+def test_split_kernels_do_not_modify_free_resources():
+    for kernel in (heuristics_nb.first_fit_decreasing, heuristics_nb.first_fit_increasing,
+                   heuristics_nb.best_fit_1b1):
+        for num_replicas, cpu_req, mem_req, free_cpu, free_mem in random_cases(1):
+            free_cpu_before = free_cpu.copy()
+            free_mem_before = free_mem.copy()
+            kernel(num_replicas, cpu_req, mem_req, free_cpu, free_mem)
+            np.testing.assert_array_equal(free_cpu, free_cpu_before)
+            np.testing.assert_array_equal(free_mem, free_mem_before)
+
+
+def test_clusters_full_after_split_matches_reference():
+    rng = np.random.default_rng(2)
+    for _ in range(NUM_CASES):
+        num_clusters = int(rng.integers(2, 17))
+        div = rng.integers(0, 5, size=num_clusters)
+        cpu_capacity = rng.choice([2.0, 4.0, 8.0], size=num_clusters)
+        memory_capacity = rng.choice([2.0, 4.0, 8.0], size=num_clusters)
+        allocated_cpu = rng.uniform(0, 8, size=num_clusters)
+        allocated_memory = rng.uniform(0, 8, size=num_clusters)
+        expected = any(allocated_cpu[d] + 0.5 * div[d] > heuristics_nb.FULL_THRESHOLD * cpu_capacity[d]
+                       or allocated_memory[d] + 0.25 * div[d] > heuristics_nb.FULL_THRESHOLD * memory_capacity[d]
+                       for d in range(num_clusters))
+        assert heuristics_nb.clusters_full_after_split(
+            div, 0.5, 0.25, allocated_cpu, allocated_memory,
+            heuristics_nb.FULL_THRESHOLD * cpu_capacity, heuristics_nb.FULL_THRESHOLD * memory_capacity) == expected
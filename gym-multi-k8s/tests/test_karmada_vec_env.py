@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("stable_baselines3")
+
+from envs.karmada_scheduling_env import KarmadaSchedulingEnv
+from envs.karmada_vec_env import KarmadaSchedulingVecEnv
+
+NUM_ENVS = 3
+NUM_CLUSTERS = 4
+NUM_STEPS = 500
+
+
+def make_env(seed, path):
+    return KarmadaSchedulingEnv(num_clusters=NUM_CLUSTERS, arrival_rate_r=100, call_duration_r=1, episode_length=100,
+                                min_replicas=1, max_replicas=16, reward_function='multi', seed=seed,
+                                file_results_name=str(path / 'results_{}'.format(seed)))
+
+
+# The vec env must step, reset and mask exactly like K envs stepped on their own
+def test_vec_env_matches_independent_envs(tmp_path):
+    (tmp_path / 'vec').mkdir()
+    (tmp_path / 'single').mkdir()
+    vec_env = KarmadaSchedulingVecEnv([lambda k=k: make_env(k, tmp_path / 'vec') for k in range(NUM_ENVS)])
+    envs = [make_env(k, tmp_path / 'single') for k in range(NUM_ENVS)]
+
+    obs = vec_env.reset()
+    np.testing.assert_array_equal(obs, np.stack([env.reset() for env in envs]))
+
+    rng = np.random.default_rng(0)
+    num_actions = vec_env.action_space.n
+    for _ in range(NUM_STEPS):
+        masks = vec_env.action_masks()
+        np.testing.assert_array_equal(masks, np.stack([env.action_masks() for env in envs]))
+
+        actions = rng.integers(0, num_actions, size=NUM_ENVS)
+        obs, rewards, dones, infos = vec_env.step(actions)
+        for k, env in enumerate(envs):
+            env_obs, reward, done, info = env.step(actions[k])
+            assert rewards[k] == np.float32(reward)  # DummyVecEnv keeps float32 rewards
+            assert dones[k] == done
+            assert "terminal_observation" not in info
+            if done:
+                np.testing.assert_array_equal(infos[k]["terminal_observation"], env_obs)
+                env_obs = env.reset()
+            else:
+                assert "terminal_observation" not in infos[k]
+            np.testing.assert_array_equal(obs[k], env_obs)
+
+    vec_env.close()
+    for env in envs:
+        env.close()
@@ -0,0 +1,99 @@
+import heapq
+
+import numpy as np
+
+from envs.karmada_scheduling_env import KarmadaSchedulingEnv, MIN_DELAY, MAX_DELAY, QUEUE_CAPACITY
+from envs.utils import DeploymentRequest
+
+NUM_CLUSTERS = 4
+NUM_REQUESTS = 3 * QUEUE_CAPACITY  # enough to grow the queue
+
+
+# Reference: the former heap of running requests, released one by one with the original per-cluster loops
+class HeapQueueRef:
+    def __init__(self, env):
+        self.allocated_cpu = env.allocated_cpu.copy()
+        self.allocated_memory = env.allocated_memory.copy()
+        self.latency_matrix = env.latency_matrix.copy()
+        self.latency = env.latency.copy()
+        self.running_requests = []
+
+    def enqueue_request(self, request):
+        heapq.heappush(self.running_requests, (request.departure_time, id(request), request))
+
+    def decrease_latency(self, n, factor):
+        for n2 in range(NUM_CLUSTERS):
+            if n == n2:
+                self.latency_matrix[n][n2] = 0
+            else:
+                self.latency_matrix[n][n2] = max(min(self.latency_matrix[n][n2] / factor, MAX_DELAY), MIN_DELAY)
+                self.latency_matrix[n2][n] = self.latency_matrix[n][n2]
+        for c in range(NUM_CLUSTERS):
+            self.latency[c] = sum(self.latency_matrix[c]) / NUM_CLUSTERS
+
+    def dequeue_until(self, arrival_time):
+        while self.running_requests and self.running_requests[0][0] < arrival_time:
+            _, _, request = heapq.heappop(self.running_requests)
+            if request.is_deployment_split:
+                for d in range(NUM_CLUSTERS):
+                    self.allocated_cpu[d] -= request.cpu_request * request.split_clusters[d]
+                    self.allocated_memory[d] -= request.memory_request * request.split_clusters[d]
+                    if request.split_clusters[d] != 0:
+                        self.decrease_latency(d, 1.10)
+            else:
+                n = request.deployed_cluster
+                self.allocated_cpu[n] -= request.num_replicas * request.cpu_request
+                self.allocated_memory[n] -= request.num_replicas * request.memory_request
+                self.decrease_latency(n, 1.15)
+
+
+def random_request(rng, departure_time):
+    request = DeploymentRequest(name='test', num_replicas=int(rng.integers(1, 9)),
+                                cpu_request=float(rng.choice([0.1, 0.25, 0.5])), cpu_limit=1.0,
+                                memory_request=float(rng.choice([0.1, 0.25, 0.5])), memory_limit=1.0,
+                                arrival_time=0.0, latency_threshold=200, departure_time=departure_time)
+    if rng.random() < 0.5:
+        request.is_deployment_split = True
+        request.split_clusters = rng.multinomial(request.num_replicas, np.ones(NUM_CLUSTERS) / NUM_CLUSTERS)
+    else:
+        request.deployed_cluster = int(rng.integers(NUM_CLUSTERS))
+    return request
+
+
+# Releasing expired rows of the Struct-of-Arrays queue must match popping the heap in departure order
+def test_running_queue_matches_heap(tmp_path):
+    env = KarmadaSchedulingEnv(num_clusters=NUM_CLUSTERS, seed=0, file_results_name=str(tmp_path / 'results'))
+    env.reset()
+    env.allocated_cpu[:] = 1000
+    env.allocated_memory[:] = 1000
+    env.free_cpu[:] = env.cpu_capacity - env.allocated_cpu
+    env.free_memory[:] = env.memory_capacity - env.allocated_memory
+    ref = HeapQueueRef(env)
+
+    rng = np.random.default_rng(0)
+    departure_times = rng.permutation(NUM_REQUESTS) + rng.random(NUM_REQUESTS)
+    for i, departure_time in enumerate(departure_times):
+        request = random_request(rng, departure_time)
+        env.enqueue_request(request)
+        ref.enqueue_request(request)
+
+        # Release in between, so that new requests reuse released slots
+        if i % 16 == 15:
+            arrival_time = departure_time - 8
+            if env._q_next_exp < arrival_time:
+                env.dequeue_request(np.flatnonzero(env._q_exp[:env._q_size] < arrival_time))
+            ref.dequeue_until(arrival_time)
+
+            np.testing.assert_allclose(env.allocated_cpu, ref.allocated_cpu)
+            np.testing.assert_allclose(env.allocated_memory, ref.allocated_memory)
+            np.testing.assert_allclose(env.free_cpu, env.cpu_capacity - ref.allocated_cpu)
+            np.testing.assert_allclose(env.free_memory, env.memory_capacity - ref.allocated_memory)
+            np.testing.assert_allclose(env.latency_matrix, ref.latency_matrix)
+            np.testing.assert_allclose(env.latency, ref.latency)
+            assert env._q_next_exp == (ref.running_requests[0][0] if ref.running_requests else np.inf)
+
+    env.dequeue_request(np.flatnonzero(env._q_exp[:env._q_size] < np.inf))
+    ref.dequeue_until(np.inf)
+    np.testing.assert_allclose(env.allocated_cpu, ref.allocated_cpu)
+    np.testing.assert_allclose(env.latency_matrix, ref.latency_matrix)
+    assert env._q_size == 0 and env._q_next_exp == np.inf
@@ -0,0 +1,24 @@
+import numpy as np
+
+from envs.utils import calculate_gini_coefficient
+
+
+# Original definition: mean absolute difference over all pairs, divided by twice the mean
+def gini_ref(loads):
+    n = len(loads)
+    mean_load = sum(loads) / n if n != 0 else 0
+    if mean_load == 0:
+        return 0
+    return sum(abs(loads[i] - loads[j]) for i in range(n) for j in range(n)) / (2 * n ** 2 * mean_load)
+
+
+def test_gini_matches_pairwise_definition():
+    rng = np.random.default_rng(0)
+    for _ in range(2000):
+        loads = rng.integers(0, 20, size=int(rng.integers(1, 33))) * rng.choice([0.5, 1.0, 1.7])
+        assert np.isclose(calculate_gini_coefficient(loads), gini_ref(loads.tolist()), rtol=1e-12, atol=1e-12)
+
+
+def test_gini_of_no_load_is_zero():
+    assert calculate_gini_coefficient(np.zeros(4)) == 0
+    assert calculate_gini_coefficient(np.zeros(0)) == 0